@@ -0,0 +1,307 @@
+"""Headless benchmarks for the inventory data paths on synthetic inventories
+
+Times the data paths of inventory_core without a Streamlit server: workbook
+parsing and cached loading, clean_dataframe_types, search, per-location
+counting, deleting selected rows, merging grid edits, convert_df_to_excel and
+batch SN/Lot lookup, and reports the inventory frame's memory as stored and
+with plain dtypes, and the memory of a snapshot and of an editing session's
+fork including their indexes.
+
+    python benchmark.py                          # 10k and 100k rows
+    python benchmark.py --rows 1000000 --repeat 1
+    python benchmark.py --cases search grid_edit_merge
+
+Each run prints a table and appends one JSON record (environment, git
+commit and per-case timings) to ``--output`` so runs can be compared.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import inventory_core as core
+
+DEFAULT_ROWS = [10_000, 100_000]
+DEFAULT_OUTPUT = Path(__file__).with_name('benchmark_results.jsonl')
+
+# Synthetic catalogue: manufacturers x products, each with a model number and (mostly) an image
+MANUFACTURERS = ['Codman', 'Integra', 'BNS', 'Elliquence', 'Luxtec', 'Medos', 'Mayfield', 'Omni-Tract', 'Licox', 'Aesculap']
+PRODUCTS = [
+    'Electrosurgical Generator', 'RF Lesion Generator', 'Lightsource', 'LED Headlight', 'Valve Programmer',
+    'Tissue Oxygen Monitor', 'Retractor System', 'Skull Clamp', 'Drill System', 'Bipolar Forceps',
+    'Suction Tip Set', 'Fiber Optic Cable', 'Footswitch', 'Power Supply', 'Demo Kit',
+]
+REMARKS = [
+    'Functional', 'Unable to power-on', 'Missing Power Supply', 'Trade-in, Dead motherboard',
+    'System Failure, Missing Magnet', 'Loaner', 'Awaiting repair', 'Calibration due',
+]
+# Results ranked per query, as the search bar's smallest limit
+SEARCH_LIMIT = 50
+SEARCH_QUERIES = ['generator', 'codman light', 'skull', 'SN0004', 'rfe', 'no such item']
+
+CASES = [
+    'convert_df_to_excel', 'workbook_parse', 'workbook_cached_load', 'clean_dataframe_types',
+    'location_index', 'location_counts', 'search_index_build', 'search', 'delete_selected', 'grid_edit_merge',
+    'serial_lookup', 'frame_memory',
+]
+
+def generate_inventory(rows, seed=0, locations=None):
+    """Synthetic inventory with ``rows`` rows following INVENTORY_SCHEMA
+
+    Items are drawn from a manufacturer x product catalogue with a skewed
+    popularity, spread over the shelf/layer locations of the shelf layout.
+    Most items are single units with a serial number; some are multi-unit
+    lots. About a quarter carry a remark and most have an image URL.
+    """
+    rng = np.random.default_rng(seed)
+    if locations is None:
+        locations = [location for room in core.load_shelf_layout()['rooms'] for _, _, location in room['locations']]
+
+    catalogue = pd.DataFrame(
+        [(f"{maker} {product}", maker, product) for maker in MANUFACTURERS for product in PRODUCTS],
+        columns=['Description', 'Maker', 'Product']
+    )
+    catalogue['Model'] = [
+        f"{maker[:3].upper()}{rng.integers(100, 9999)}-{chr(65 + rng.integers(0, 26))}"
+        for maker in catalogue['Maker']
+    ]
+    has_image = rng.random(len(catalogue)) < 0.75
+    catalogue['Image_URL'] = np.where(
+        has_image,
+        'https://images.example.com/products/' + catalogue['Description'].str.replace(' ', '-').str.lower() + '.jpg',
+        ''
+    )
+
+    # Zipf-like popularity: a few catalogue items make up most of the stock
+    weights = 1.0 / np.arange(1, len(catalogue) + 1)
+    items = catalogue.iloc[rng.choice(len(catalogue), size=rows, p=weights / weights.sum())].reset_index(drop=True)
+
+    lots = rng.random(rows) < 0.15
+    units = np.where(lots, rng.integers(2, 51, size=rows), 1)
+    has_serial = rng.random(rows) < 0.7
+    serials = np.where(
+        has_serial,
+        np.where(lots, 'LOT', 'SN') + pd.Series(rng.permutation(rows)).map('{:07d}'.format).to_numpy(dtype=object),
+        ''
+    )
+    remarks = np.where(rng.random(rows) < 0.25, np.array(REMARKS, dtype=object)[rng.integers(0, len(REMARKS), size=rows)], '')
+    image_urls = np.where(rng.random(rows) < 0.9, items['Image_URL'], '')
+
+    df = pd.DataFrame({
+        'Location': np.array(locations, dtype=object)[rng.integers(0, len(locations), size=rows)],
+        'Description': items['Description'],
+        'Unit': units,
+        'Model': items['Model'],
+        'SN/Lot': serials,
+        'Remark': remarks,
+        'Image_URL': image_urls,
+    })
+    return core.clean_dataframe_types(df)
+
+def time_case(func, setup=None, repeat=3):
+    """Wall times in seconds of ``func(setup())`` (setup untimed) over ``repeat`` runs"""
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(state)
+        times.append(time.perf_counter() - start)
+    return times
+
+def grid_edit(store, location, rng, edits=20):
+    """Grid data for ``location`` as AgGrid returns it, with ``edits`` cells changed"""
+    edited = core.logical_frame(store.location_data(location)).reset_index(drop=True)
+    picked = rng.choice(len(edited), size=min(edits, len(edited)), replace=False)
+    edited.loc[picked, 'Remark'] = 'Edited in grid'
+    edited.loc[picked[::2], 'Unit'] = edited.loc[picked[::2], 'Unit'] + 1
+    return edited
+
+def merge_grid_edit(store, edited):
+    """The inventory editor's path from returned grid data to updated cells"""
+    edited = edited.set_axis(edited[core.ROW_ID_COLUMN].astype('int64').to_numpy())
+    edited = edited[edited.index.isin(store.df.index)]
+    edited, _ = core.validate_inventory_rows(edited)
+    changes = core.diff_grid_edits(store.df, edited)
+    if changes:
+        store.update_cells(changes)
+    return changes
+
+def run_benchmarks(rows, cases=CASES, repeat=3, seed=0):
+    """Benchmark results for an inventory of ``rows`` rows, one dict per case"""
+    rng = np.random.default_rng(seed)
+    df = generate_inventory(rows, seed)
+    results = []
+
+    def record(case, times, **extra):
+        results.append({
+            'rows': rows,
+            'case': case,
+            'runs': len(times),
+            'min_ms': round(min(times) * 1000, 3),
+            'median_ms': round(statistics.median(times) * 1000, 3),
+            'mean_ms': round(statistics.fmean(times) * 1000, 3),
+            'max_ms': round(max(times) * 1000, 3),
+            **extra
+        })
+        label = f"{case} ({extra['query']!r})" if 'query' in extra else case
+        print(f"{rows:>9,} {label:<36} {results[-1]['median_ms']:>12,.1f} ms", file=sys.stderr)
+
+    # Workbook bytes are needed for the load/parse cases even when the export itself isn't timed
+    raw = None
+    if 'convert_df_to_excel' in cases:
+        outputs = []
+        record('convert_df_to_excel', time_case(lambda _: outputs.append(core.convert_df_to_excel(df)), repeat=repeat))
+        raw = outputs[-1]
+    needs_workbook = {'workbook_parse', 'workbook_cached_load', 'clean_dataframe_types'} & set(cases)
+    if raw is None and needs_workbook:
+        raw = core.convert_df_to_excel(df)
+
+    parsed = None
+    if 'workbook_parse' in cases:
+        outputs = []
+        record('workbook_parse', time_case(lambda _: outputs.append(core._parse_workbook(raw)), repeat=repeat),
+               workbook_bytes=len(raw))
+        parsed = outputs[-1]
+
+    if 'workbook_cached_load' in cases:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # Prime the on-disk cache (raw workbook, Parquet sidecar, metadata) as a fetch would
+            cache_dir = Path(cache_dir)
+            core._parse_workbook(raw, cache_dir / 'workbook.parquet')
+            (cache_dir / 'workbook.xlsx').write_bytes(raw)
+            (cache_dir / 'workbook.json').write_text(json.dumps({'url': core.EXCEL_FILE_URL, 'fetched_at': time.time()}))
+            record('workbook_cached_load', time_case(
+                lambda _: core.fetch_inventory_workbook(cache_dir=cache_dir, ttl=float('inf')), repeat=repeat
+            ))
+
+    if 'clean_dataframe_types' in cases:
+        if parsed is None:
+            parsed = core._parse_workbook(raw)
+        record('clean_dataframe_types', time_case(lambda _: core.clean_dataframe_types(parsed), repeat=repeat))
+
+    store = core.InventoryStore(df)
+    if 'location_index' in cases:
+        record('location_index', time_case(lambda _: core.InventoryStore(df), repeat=repeat))
+    if 'location_counts' in cases:
+        record('location_counts', time_case(lambda _: (store.counts(), store.location_stats()), repeat=repeat))
+
+    if 'search_index_build' in cases:
+        record('search_index_build', time_case(lambda _: core.SearchIndex(store.df), repeat=repeat))
+    if 'search' in cases:
+        store.search_index
+        for query in SEARCH_QUERIES:
+            totals = []
+            times = time_case(lambda _: totals.append(store.search(query, limit=SEARCH_LIMIT)[1]), repeat=repeat)
+            record('search', times, query=query, matches=totals[-1])
+
+    # Largest location, as the editor would show it
+    location = max(store.counts().items(), key=lambda item: item[1])[0]
+    if 'delete_selected' in cases:
+        def fork_and_select(_=None):
+            fork = store.fork()
+            labels = fork.location_labels(location)
+            return fork, rng.choice(labels, size=min(50, len(labels)), replace=False)
+        record('delete_selected', time_case(
+            lambda state: state[0].delete_rows(state[0].df.index.intersection(state[1])),
+            setup=fork_and_select, repeat=repeat
+        ), location=location, location_rows=store.count(location), deleted=min(50, store.count(location)))
+
+    if 'grid_edit_merge' in cases:
+        record('grid_edit_merge', time_case(
+            lambda state: merge_grid_edit(*state),
+            setup=lambda: (store.fork(), grid_edit(store, location, rng)), repeat=repeat
+        ), location=location, location_rows=store.count(location))
+
+    if 'serial_lookup' in cases:
+        # A stock-take of 500 scans: mostly stored codes, some unknown, one location counted
+        stored = store.df.loc[store.df['SN/Lot'] != '', 'SN/Lot']
+        codes = stored.sample(min(450, len(stored)), random_state=seed).tolist() + [f"UNKNOWN{i}" for i in range(50)]
+        record('serial_index_build', time_case(lambda _: core.SerialIndex(store.df), repeat=repeat))
+        store.serial_index
+        record('serial_lookup', time_case(lambda _: core.reconcile_scans(store, codes, [location]), repeat=repeat),
+               codes=len(codes))
+
+    if 'frame_memory' in cases:
+        # The frame alone, as stored and with plain dtypes
+        memory = core.frame_memory(store.df)
+        results.append({
+            'case': 'frame_memory',
+            **memory,
+            'stored_bytes_per_row': round(memory['stored_bytes'] / max(rows, 1), 1),
+            'plain_bytes_per_row': round(memory['plain_bytes'] / max(rows, 1), 1),
+        })
+        print(f"{rows:>9,} {'frame_memory':<36} {memory['stored_bytes'] / 1024 ** 2:>12,.1f} MB"
+              f" ({memory['plain_bytes'] / 1024 ** 2:,.1f} MB with plain dtypes)", file=sys.stderr)
+        
+        # Bytes per session that edits: its fork's own frame copy, location index and index copies
+        snapshot = core.InventoryStore(store.df)
+        snapshot.search_index
+        snapshot.serial_index
+        snapshot.read_only = True
+        fork = snapshot.fork()
+        fork.update_cells({'Remark': pd.Series({int(fork.df.index[0]): 'Checked'})})
+        fork.search_index
+        fork.serial_index
+        for case, measured in [('snapshot_memory', snapshot), ('session_fork_memory', fork)]:
+            parts = measured.memory_breakdown()
+            results.append({'case': case, 'rows': rows, 'bytes': sum(parts.values()),
+                            **{f'{part}_bytes': size for part, size in parts.items()}})
+            print(f"{rows:>9,} {case:<36} {sum(parts.values()) / 1024 ** 2:>12,.1f} MB"
+                  f" (frame {parts['frame'] / 1024 ** 2:,.1f} MB)", file=sys.stderr)
+
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help="inventory sizes to benchmark")
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES, help="cases to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the synthetic inventory")
+    parser.add_argument('--output', type=Path, default=DEFAULT_OUTPUT,
+                        help="JSON-lines file the run's record is appended to ('-' for stdout)")
+    parser.add_argument('--write-inventory', type=Path, metavar='XLSX',
+                        help="also write the largest synthetic inventory as a workbook and exit")
+    args = parser.parse_args(argv)
+
+    if args.write_inventory:
+        args.write_inventory.write_bytes(core.convert_df_to_excel(generate_inventory(max(args.rows), args.seed)))
+        return
+
+    results = []
+    for rows in args.rows:
+        results.extend(run_benchmarks(rows, args.cases, args.repeat, args.seed))
+
+    record = json.dumps({
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'results': results,
+    })
+    if str(args.output) == '-':
+        print(record)
+    else:
+        with open(args.output, 'a', encoding='utf-8') as f:
+            f.write(record + '\n')
+        print(f"Results appended to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+"""Command line and local JSON API for the inventory, without the Streamlit UI
+
+Reads the saved inventory (or the workbook, before anything was saved) through
+inventory_core and prints JSON:
+
+    python inventory_cli.py search "codman light" --limit 10
+    python inventory_cli.py locations                  # per-location stats
+    python inventory_cli.py location A3                # items stored at A3
+    python inventory_cli.py stats
+    python inventory_cli.py export --format csv --output inventory.csv
+    python inventory_cli.py serve --port 8765
+
+``serve`` answers ``GET /search?q=&limit=``, ``/locations``,
+``/locations/<location>``, ``/stats`` and ``/export?format=xlsx|csv|parquet``
+from one read-only store whose search and SN/Lot indexes are built at
+startup, so concurrent requests only read memory. When the app saves to the
+journal, the server loads the new data in the background and swaps it in.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import inventory_core as core
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = int(os.environ.get('INVENTORY_API_PORT', 8765))
+DEFAULT_SEARCH_LIMIT = 50
+# Seconds between checks of the journal for data saved by the app
+RELOAD_INTERVAL = float(os.environ.get('INVENTORY_API_RELOAD_INTERVAL', 5))
+# Encoded JSON responses kept per served store
+RESPONSE_CACHE_SIZE = int(os.environ.get('INVENTORY_API_RESPONSE_CACHE', 512))
+
+# Short format names -> EXPORT_FORMATS labels
+EXPORT_EXTENSIONS = {extension: label for label, (_, extension, _) in core.EXPORT_FORMATS.items()}
+
+JSON_CONTENT_TYPE = 'application/json; charset=utf-8'
+
+logger = logging.getLogger('inventory.api')
+
+def records(df):
+    """JSON-ready rows of a stored frame
+
+    Built column by column with ``tolist()``, which yields plain Python values
+    from the compact dtypes several times faster than converting the frame
+    with logical_frame() and ``to_dict('records')``.
+    """
+    columns = list(df.columns)
+    return [dict(zip(columns, row)) for row in zip(*(df[col].tolist() for col in columns))]
+
+def search_payload(store, query, limit=DEFAULT_SEARCH_LIMIT):
+    rows, total = store.search(query, limit)
+    return {'query': query, 'total': total, 'items': records(rows)}
+
+def locations_payload(store):
+    """Per-location rows, units and image counts, in shelf layout order"""
+    stats = store.location_stats()
+    layout = [location for room in core.load_shelf_layout()['rooms'] for _, _, location in room['locations']]
+    # Locations missing from the layout (e.g. imported ones) follow in name order
+    ordered = layout + sorted(set(stats) - set(layout))
+    payload = {}
+    for location in ordered:
+        rows, units, images = stats.get(location, (0, 0, 0))
+        payload[location] = {
+            'position': core.location_layer_position(location),
+            'items': rows,
+            'units': units,
+            'images': images,
+        }
+    return payload
+
+def location_payload(store, location):
+    return {
+        'location': location,
+        'position': core.location_layer_position(location),
+        'items': records(store.location_data(location)),
+    }
+
+def stats_payload(store):
+    """Inventory totals plus per-room and per-shelf totals from the shelf layout"""
+    stats = store.location_stats()
+    rooms = []
+    for room in core.load_shelf_layout()['rooms']:
+        shelves = {}
+        for shelf, _, location in room['locations']:
+            rows, units, images = stats.get(location, (0, 0, 0))
+            totals = shelves.setdefault(shelf, {'items': 0, 'units': 0, 'images': 0})
+            totals['items'] += rows
+            totals['units'] += units
+            totals['images'] += images
+        rooms.append({
+            'name': room['name'],
+            'items': sum(totals['items'] for totals in shelves.values()),
+            'units': sum(totals['units'] for totals in shelves.values()),
+            'shelves': shelves,
+        })
+    return {
+        'items': len(store),
+        'units': sum(units for _, units, _ in stats.values()),
+        'images': sum(images for _, _, images in stats.values()),
+        'locations': len(stats),
+        'rooms': rooms,
+    }
+
+def export_payload(store, fmt):
+    """Return (bytes, file extension, MIME type) of an export in a short format name"""
+    label = EXPORT_EXTENSIONS[fmt]
+    _, extension, mime = core.EXPORT_FORMATS[label]
+    return store.export(label), extension, mime
+
+def dumps(payload):
+    return json.dumps(payload, default=core._json_default, ensure_ascii=False)
+
+class ResponseCache:
+    """Bounded LRU of encoded responses for one read-only store"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+                return body
+        body = build()
+        with self._lock:
+            self._entries[key] = body
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+class InventoryService:
+    """The read-only store the API answers from, reloaded when the journal changes
+
+    Indexes are built before a store is served. The store never changes while
+    it is served, so encoded responses are cached alongside it. Reloads run on
+    a background thread; requests keep reading the previous store until the
+    new one is swapped in.
+    """
+
+    def __init__(self, data_dir=core.INVENTORY_DATA_DIR, reload_interval=RELOAD_INTERVAL):
+        self.data_dir = Path(data_dir)
+        self.reload_interval = reload_interval
+        self._journal = core.InventoryJournal(self.data_dir)
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._checked_at = time.monotonic()
+        self._stamp = self._data_stamp()
+        self.served = (self._open(), ResponseCache())
+
+    def _data_stamp(self):
+        stamp = []
+        for path in (self._journal.snapshot_path, self._journal.journal_path):
+            try:
+                stat = path.stat()
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    @core.timed('api_open_inventory')
+    def _open(self):
+        store = core.open_inventory(self.data_dir)
+        store.read_only = True
+        store.search_index
+        store.serial_index
+        return store
+
+    def _reload(self, stamp):
+        try:
+            store = self._open()
+        except Exception:
+            logger.exception("Reloading the inventory failed; still serving the previous data")
+        else:
+            self.served = (store, ResponseCache())
+            self._stamp = stamp
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def current(self):
+        """(store, response cache) to answer a request from, starting a reload if saved data changed"""
+        if self.reload_interval is not None and time.monotonic() - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if not self._reloading and time.monotonic() - self._checked_at >= self.reload_interval:
+                    self._checked_at = time.monotonic()
+                    stamp = self._data_stamp()
+                    if stamp != self._stamp:
+                        self._reloading = True
+                        threading.Thread(target=self._reload, args=(stamp,), daemon=True).start()
+        return self.served
+
+class InventoryRequestHandler(BaseHTTPRequestHandler):
+    """GET-only JSON endpoints over ``server.service``"""
+
+    server_version = 'InventoryAPI/1.0'
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [unquote(part) for part in url.path.strip('/').split('/') if part]
+        store, responses = self.server.service.current()
+        endpoint = parts[0] if parts else ''
+
+        def send_cached(build):
+            key = (tuple(parts), tuple(sorted(params.items())))
+            self._send(HTTPStatus.OK, responses.get(key, lambda: dumps(build()).encode('utf-8')), JSON_CONTENT_TYPE)
+
+        try:
+            if parts == ['search']:
+                limit = int(params.get('limit', DEFAULT_SEARCH_LIMIT))
+                if limit < 1:
+                    raise ValueError("limit must be positive")
+                send_cached(lambda: search_payload(store, params.get('q', ''), limit))
+            elif parts == ['locations']:
+                send_cached(lambda: locations_payload(store))
+            elif len(parts) == 2 and parts[0] == 'locations':
+                send_cached(lambda: location_payload(store, parts[1]))
+            elif parts == ['stats']:
+                send_cached(lambda: stats_payload(store))
+            elif parts == ['export']:
+                fmt = params.get('format', 'xlsx')
+                if fmt not in EXPORT_EXTENSIONS:
+                    raise ValueError(f"format must be one of {', '.join(EXPORT_EXTENSIONS)}")
+                data, extension, mime = export_payload(store, fmt)
+                self._send(HTTPStatus.OK, data, mime,
+                           {'Content-Disposition': f'attachment; filename="inventory_data.{extension}"'})
+            else:
+                endpoint = 'not_found'
+                self._send_json({'error': f"No such endpoint: {url.path}"}, HTTPStatus.NOT_FOUND)
+        except ValueError as e:
+            self._send_json({'error': str(e)}, HTTPStatus.BAD_REQUEST)
+        core.get_perf_recorder().record(f'api_{endpoint or "root"}', time.perf_counter() - start)
+
+    def _send_json(self, payload, status=HTTPStatus.OK):
+        self._send(status, dumps(payload).encode('utf-8'), JSON_CONTENT_TYPE)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+class InventoryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, InventoryRequestHandler)
+        self.service = service
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, data_dir=core.INVENTORY_DATA_DIR, reload_interval=RELOAD_INTERVAL):
+    """Serve the JSON API until interrupted"""
+    service = InventoryService(data_dir, reload_interval)
+    server = InventoryServer((host, port), service)
+    logger.info("Serving %d rows on http://%s:%d", len(service.served[0]), *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--data-dir', type=Path, default=core.INVENTORY_DATA_DIR,
+                        help="saved inventory directory (default: INVENTORY_DATA_DIR)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    search = commands.add_parser('search', help="ranked search over Description, SN/Lot and Model")
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=DEFAULT_SEARCH_LIMIT, help="results to return")
+
+    commands.add_parser('locations', help="rows, units and images per location")
+
+    location = commands.add_parser('location', help="items stored at one location")
+    location.add_argument('location')
+
+    commands.add_parser('stats', help="inventory totals per room and shelf")
+
+    export = commands.add_parser('export', help="export the whole inventory")
+    export.add_argument('--format', choices=list(EXPORT_EXTENSIONS), default='xlsx')
+    export.add_argument('--output', type=Path, help="file to write (default: stdout)")
+
+    server = commands.add_parser('serve', help="serve the local JSON API")
+    server.add_argument('--host', default=DEFAULT_HOST)
+    server.add_argument('--port', type=int, default=DEFAULT_PORT)
+    server.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL,
+                        help="seconds between checks for newly saved data")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        # Request log on stderr; the perf log keeps going to INVENTORY_PERF_LOG only
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        serve(args.host, args.port, args.data_dir, args.reload_interval)
+        return
+
+    store = core.open_inventory(args.data_dir)
+    if args.command == 'export':
+        data, _, _ = export_payload(store, args.format)
+        if args.output is None:
+            sys.stdout.buffer.write(data)
+        else:
+            args.output.write_bytes(data)
+        return
+
+    if args.command == 'search':
+        payload = search_payload(store, args.query, args.limit)
+    elif args.command == 'locations':
+        payload = locations_payload(store)
+    elif args.command == 'location':
+        payload = location_payload(store, args.location)
+    else:
+        payload = stats_payload(store)
+    print(dumps(payload))
+
+if __name__ == '__main__':
+    main()
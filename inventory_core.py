@@ -0,0 +1,1743 @@
+"""Inventory core: loading, validation, storage, search, import, export and persistence
+
+Everything here works without Streamlit so scripts, the CLI and the JSON API
+(see inventory_cli.py) can query the inventory without starting the UI;
+streamlit_app.py renders on top of it.
+"""
+import pandas as pd
+import numpy as np
+import requests
+from io import BytesIO
+import xlsxwriter
+import openpyxl
+import re
+import json
+import os
+import time
+import copy
+import functools
+import sqlite3
+from contextlib import closing
+import threading
+import logging
+import math
+import sys
+from array import array
+from collections import deque
+from pathlib import Path
+
+# GitHub URLs
+EXCEL_FILE_URL = "https://raw.githubusercontent.com/Montsmed/Sample_Room/main/inventory_data.xlsx"  # Replace with your actual Excel file URL
+
+# Workbook loading: bundled fallback copy, on-disk cache, HTTP timeouts (connect, read) and cache TTL
+LOCAL_EXCEL_FILE = Path(__file__).with_name('inventory_data.xlsx')
+WORKBOOK_CACHE_DIR = Path(os.environ.get('INVENTORY_CACHE_DIR', Path(__file__).with_name('.inventory_cache')))
+WORKBOOK_TIMEOUT = (float(os.environ.get('INVENTORY_CONNECT_TIMEOUT', 5)), float(os.environ.get('INVENTORY_READ_TIMEOUT', 30)))
+WORKBOOK_TTL_SECONDS = float(os.environ.get('INVENTORY_CACHE_TTL', 300))
+
+# Saved edits: journal + snapshot directory, snapshot format ('sqlite' or 'xlsx'),
+# and how many journal records trigger a compaction into a new snapshot
+INVENTORY_DATA_DIR = Path(os.environ.get('INVENTORY_DATA_DIR', Path(__file__).with_name('.inventory_data')))
+SNAPSHOT_FORMAT = os.environ.get('INVENTORY_SNAPSHOT_FORMAT', 'sqlite')
+JOURNAL_COMPACT_RECORDS = int(os.environ.get('INVENTORY_JOURNAL_COMPACT_RECORDS', 1000))
+
+# Rooms, shelves and layers (see shelf_layout.json)
+SHELF_LAYOUT_FILE = Path(os.environ.get('INVENTORY_SHELF_LAYOUT', Path(__file__).with_name('shelf_layout.json')))
+
+# Hidden, unique per-row ID carried through the grid to key edits and deletes
+ROW_ID_COLUMN = '_row_id'
+
+# Inventory schema: column -> dtype, enforced on ingest and on every inserted or edited row
+INVENTORY_SCHEMA = {
+    'Location': 'string',
+    'Description': 'string',
+    'Unit': 'int64',
+    'Model': 'string',
+    'SN/Lot': 'string',
+    'Remark': 'string',
+    'Image_URL': 'string',
+}
+STRING_COLUMNS = [col for col, dtype in INVENTORY_SCHEMA.items() if dtype == 'string']
+
+# Compact in-memory storage of the same columns: repetitive values as categoricals, free text as
+# Arrow-backed strings and a narrower Unit (INVENTORY_COMPACT_DTYPES=0 stores INVENTORY_SCHEMA as is)
+COMPACT_DTYPES = os.environ.get('INVENTORY_COMPACT_DTYPES', '1').lower() not in ('0', 'false', 'no')
+COMPACT_SCHEMA = {
+    'Location': 'category',
+    'Description': 'string[pyarrow]',
+    'Unit': 'int32',
+    'Model': 'category',
+    'SN/Lot': 'string[pyarrow]',
+    'Remark': 'category',
+    'Image_URL': 'category',
+}
+STORAGE_SCHEMA = COMPACT_SCHEMA if COMPACT_DTYPES else INVENTORY_SCHEMA
+UNIT_MAX = int(np.iinfo(STORAGE_SCHEMA['Unit']).max)
+
+# Excel exports at least this long are written in constant-memory mode; longer than Excel's
+# per-sheet hyperlink limit, URLs are written as plain text instead of being dropped
+EXCEL_CONSTANT_MEMORY_ROWS = 50_000
+EXCEL_MAX_URLS = 65_530
+
+# Bulk import: rows read and validated per chunk, rejected-row problems kept for the summary,
+# and the server directory files may be imported from by path (unset: uploads only)
+IMPORT_CHUNK_ROWS = int(os.environ.get('INVENTORY_IMPORT_CHUNK_ROWS', 5000))
+IMPORT_MAX_ISSUES = 1000
+IMPORT_DIR = os.environ.get('INVENTORY_IMPORT_DIR')
+
+# Performance instrumentation: samples kept per section for the rolling percentiles and an
+# optional JSON-lines log of every sample
+PERF_WINDOW = int(os.environ.get('INVENTORY_PERF_WINDOW', 200))
+PERF_LOG_FILE = os.environ.get('INVENTORY_PERF_LOG')
+
+perf_logger = logging.getLogger('inventory.perf')
+logger = logging.getLogger('inventory')
+
+class PerfRecorder:
+    """Rolling timing samples per instrumented section, shared by all sessions
+
+    Each section keeps its last ``window`` durations (seconds) for p50/p95.
+    Every sample is also emitted to the ``inventory.perf`` logger as a
+    one-line JSON record, and appended to ``log_file`` if one is given.
+    """
+
+    def __init__(self, window=PERF_WINDOW, log_file=PERF_LOG_FILE):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+        if log_file and not any(getattr(handler, 'baseFilename', None) == os.path.abspath(log_file)
+                                for handler in perf_logger.handlers):
+            handler = logging.FileHandler(log_file)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            perf_logger.addHandler(handler)
+            perf_logger.setLevel(logging.INFO)
+
+    def record(self, section, seconds, **fields):
+        with self._lock:
+            samples = self._samples.get(section)
+            if samples is None:
+                samples = self._samples[section] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._totals[section] = self._totals.get(section, 0) + 1
+        if perf_logger.isEnabledFor(logging.INFO):
+            perf_logger.info(json.dumps({'ts': time.time(), 'section': section, 'ms': round(seconds * 1000, 3), **fields}))
+
+    @staticmethod
+    def _percentile(ordered, q):
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+    def summary(self):
+        """Mapping of section -> {count, window, last_ms, p50_ms, p95_ms, max_ms}"""
+        with self._lock:
+            samples = {section: list(values) for section, values in self._samples.items()}
+            totals = dict(self._totals)
+        summary = {}
+        for section, values in samples.items():
+            ordered = sorted(values)
+            summary[section] = {
+                'count': totals[section],
+                'window': len(values),
+                'last_ms': round(values[-1] * 1000, 3),
+                'p50_ms': round(self._percentile(ordered, 0.50) * 1000, 3),
+                'p95_ms': round(self._percentile(ordered, 0.95) * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+            }
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+_perf_recorder = PerfRecorder()
+
+def get_perf_recorder():
+    """Timing samples for this process"""
+    return _perf_recorder
+
+def timed(section):
+    """Decorator recording the wall time of every call under ``section``"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                get_perf_recorder().record(section, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def estimate_size(value, _seen=None):
+    """Approximate deep size in bytes of a value (frames and stores by their memory_usage)"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    if hasattr(value, 'memory_usage') and not isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage())
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(key, _seen) + estimate_size(item, _seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _seen) for item in value)
+    return size
+
+def _dict_bytes(mapping):
+    """Approximate bytes of a dict and its keys (values are left to the caller)"""
+    return sys.getsizeof(mapping) + sum(map(sys.getsizeof, mapping))
+
+def _fsync_path(path):
+    """fsync a file, or a directory so the renames in it survive a crash"""
+    if not hasattr(os, 'O_DIRECTORY') and Path(path).is_dir():
+        # Directories can't be opened (or synced) on Windows
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _replace_synced(tmp_path, path):
+    """Rename a fully written ``tmp_path`` over ``path``, with its data on disk before and the rename after"""
+    _fsync_path(tmp_path)
+    os.replace(tmp_path, path)
+    _fsync_path(path.parent)
+
+def _write_atomic(path, data):
+    """Replace ``path`` with ``data``: after a crash it holds either the old or the new data in full"""
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(data)
+    _replace_synced(tmp_path, path)
+
+def _parse_workbook(raw, sidecar_path=None):
+    """Parse workbook bytes, writing a Parquet sidecar so later loads skip xlsx parsing"""
+    df = pd.read_excel(BytesIO(raw))
+    if sidecar_path is not None:
+        # Mixed-type columns (e.g. a non-numeric Unit) are kept as text for validation
+        df = df.astype({col: 'string' for col in df.columns if not pd.api.types.is_numeric_dtype(df[col])})
+        output = BytesIO()
+        df.to_parquet(output, index=False)
+        _write_atomic(sidecar_path, output.getvalue())
+    return df
+
+def fetch_inventory_workbook(url=EXCEL_FILE_URL, cache_dir=WORKBOOK_CACHE_DIR, fallback_file=LOCAL_EXCEL_FILE,
+                             timeout=WORKBOOK_TIMEOUT, ttl=WORKBOOK_TTL_SECONDS, revalidate=False):
+    """Load the raw inventory workbook as a DataFrame
+
+    The raw workbook and a parsed Parquet sidecar are cached in ``cache_dir``.
+    Within ``ttl`` seconds the sidecar is used without any request (unless
+    ``revalidate``); after that the server is asked with ETag /
+    If-Modified-Since and a 304 reuses the sidecar. A cached copy that can't
+    be read is treated as missing and fetched again. If the request fails,
+    the cached copy is used, then the bundled ``fallback_file``.
+
+    Returns ``(df, source, error)``: ``source`` is 'remote', 'not-modified',
+    'cache', 'stale-cache' or 'bundled', and ``error`` is the exception that
+    forced a fallback, or None.
+    """
+    cache_dir = Path(cache_dir)
+    raw_path = cache_dir / 'workbook.xlsx'
+    sidecar_path = cache_dir / 'workbook.parquet'
+    meta_path = cache_dir / 'workbook.json'
+    
+    try:
+        meta = json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        meta = {}
+    cached = meta.get('url') == url and raw_path.exists()
+    
+    def load_cached():
+        if sidecar_path.exists():
+            try:
+                return pd.read_parquet(sidecar_path)
+            except Exception:
+                pass
+        return _parse_workbook(raw_path.read_bytes(), sidecar_path)
+    
+    if cached and not revalidate and time.time() - meta.get('fetched_at', 0) < ttl:
+        try:
+            return load_cached(), 'cache', None
+        except Exception:
+            # Corrupt or truncated cache files: fetch the workbook again
+            cached = False
+    
+    headers = {}
+    if cached and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if cached and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if cached and response.status_code == 304:
+            try:
+                df = load_cached()
+            except Exception:
+                cached = False
+                response = requests.get(url, timeout=timeout)
+            else:
+                meta['fetched_at'] = time.time()
+                _write_atomic(meta_path, json.dumps(meta).encode())
+                return df, 'not-modified', None
+        response.raise_for_status()
+        
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        df = _parse_workbook(response.content, sidecar_path)
+        _write_atomic(raw_path, response.content)
+        _write_atomic(meta_path, json.dumps({
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time()
+        }).encode())
+        return df, 'remote', None
+    except Exception as e:
+        error = e
+    
+    if cached:
+        try:
+            return load_cached(), 'stale-cache', error
+        except Exception:
+            pass
+    return pd.read_excel(fallback_file), 'bundled', error
+
+# Load data from GitHub Excel file
+@timed('load_inventory_frame')
+def load_inventory_frame(revalidate=False):
+    """Load and validate the inventory workbook (see fetch_inventory_workbook)
+
+    Returns ``(df, source, error, issues)``: rows that pass
+    validate_inventory_rows under stable row IDs, where the workbook came
+    from, the error that forced a fallback (or None) and the rejected rows.
+    """
+    df, source, error = fetch_inventory_workbook(revalidate=revalidate)
+    
+    # Assign stable row IDs
+    df[ROW_ID_COLUMN] = range(len(df))
+    
+    # Validate against the schema
+    df, issues = validate_inventory_rows(df)
+    return df, source, error, issues
+
+def empty_inventory_frame(with_row_id=False):
+    """Empty DataFrame with the inventory storage schema"""
+    columns = {col: pd.Series([], dtype=dtype) for col, dtype in STORAGE_SCHEMA.items()}
+    if with_row_id:
+        columns[ROW_ID_COLUMN] = pd.Series([], dtype='int64')
+    return pd.DataFrame(columns)
+
+def validate_inventory_rows(df):
+    """Validate rows against INVENTORY_SCHEMA and coerce the valid ones
+
+    Returns ``(valid_rows, issues)`` where ``issues`` is a DataFrame with one
+    row per problem (Row, Column, Value, Problem), keyed by the input row
+    label. Rejected rows are left out of ``valid_rows`` instead of being
+    silently coerced.
+    """
+    missing = [col for col in INVENTORY_SCHEMA if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing inventory column(s): {', '.join(missing)}")
+    
+    problems = []
+    
+    # Unit must be a non-negative whole number; a blank Unit counts as 0
+    units = pd.to_numeric(df['Unit'], errors='coerce')
+    not_numeric = df['Unit'].notna() & (df['Unit'].astype(str).str.strip() != '') & units.isna()
+    not_whole = units.notna() & ((units % 1 != 0) | (units < 0))
+    too_large = units.notna() & ~not_whole & (units > UNIT_MAX)
+    for label in df.index[not_numeric]:
+        problems.append((label, 'Unit', df.at[label, 'Unit'], 'not a number'))
+    for label in df.index[not_whole]:
+        problems.append((label, 'Unit', df.at[label, 'Unit'], 'not a non-negative whole number'))
+    for label in df.index[too_large]:
+        problems.append((label, 'Unit', df.at[label, 'Unit'], f'larger than {UNIT_MAX}'))
+    
+    # Every item needs a location
+    no_location = df['Location'].isna() | (df['Location'].astype(str).str.strip() == '')
+    for label in df.index[no_location]:
+        problems.append((label, 'Location', df.at[label, 'Location'], 'missing location'))
+    
+    issues = pd.DataFrame(problems, columns=['Row', 'Column', 'Value', 'Problem'])
+    issues = issues.sort_values('Row', kind='stable', ignore_index=True)
+    issues['Value'] = issues['Value'].astype(str)
+    valid = df.drop(index=issues['Row'].unique())
+    return clean_dataframe_types(valid), issues
+
+@timed('clean_dataframe_types')
+def clean_dataframe_types(df):
+    """Coerce DataFrame columns to INVENTORY_SCHEMA for Arrow compatibility, stored as STORAGE_SCHEMA"""
+    df_clean = df.copy()
+    
+    # Convert all columns to appropriate types
+    for col in STRING_COLUMNS:
+        df_clean[col] = df_clean[col].astype('string')
+    df_clean['Unit'] = pd.to_numeric(df_clean['Unit'], errors='coerce').fillna(0).astype('int64')
+    
+    # Replace NaN values with empty strings for string columns
+    for col in STRING_COLUMNS:
+        df_clean[col] = df_clean[col].fillna('')
+    
+    if ROW_ID_COLUMN in df_clean.columns:
+        df_clean[ROW_ID_COLUMN] = df_clean[ROW_ID_COLUMN].astype('int64')
+    
+    if COMPACT_DTYPES:
+        df_clean = df_clean.astype(COMPACT_SCHEMA)
+    
+    return df_clean
+
+def logical_frame(df):
+    """Copy of stored rows with the plain INVENTORY_SCHEMA dtypes, for the grid, exports and comparisons"""
+    return df.astype({col: dtype for col, dtype in INVENTORY_SCHEMA.items() if col in df.columns})
+
+def frame_memory(df):
+    """Bytes held by the frame alone, as stored and as it would be with plain INVENTORY_SCHEMA dtypes
+
+    A store's indexes are not included; see InventoryStore.memory_breakdown.
+    """
+    return {
+        'rows': len(df),
+        'stored_bytes': int(df.memory_usage(deep=True).sum()),
+        'plain_bytes': int(logical_frame(df).memory_usage(deep=True).sum()),
+    }
+
+@timed('convert_df_to_excel')
+def convert_df_to_excel(df, constant_memory=None):
+    """Convert dataframe to Excel format for download
+
+    Exports of ``EXCEL_CONSTANT_MEMORY_ROWS`` rows or more are written in
+    xlsxwriter's constant-memory mode, which flushes each row as it is written.
+    """
+    if constant_memory is None:
+        constant_memory = len(df) >= EXCEL_CONSTANT_MEMORY_ROWS
+    
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': constant_memory,
+        'in_memory': not constant_memory,
+        'strings_to_urls': len(df) <= EXCEL_MAX_URLS,
+        'strings_to_formulas': False
+    })
+    worksheet = workbook.add_worksheet('Inventory')
+    
+    # Add some formatting
+    header_format = workbook.add_format({
+        'bold': True,
+        'text_wrap': True,
+        'valign': 'top',
+        'fg_color': '#D7E4BC',
+        'border': 1
+    })
+    
+    # Auto-adjust column widths (set before any row is written)
+    for i, col in enumerate(df.columns):
+        if len(df) > 0:  # Only if dataframe has data
+            max_length = max(
+                df[col].astype(str).str.len().max(),
+                len(str(col))
+            ) + 2
+        else:
+            max_length = len(str(col)) + 2
+        worksheet.set_column(i, i, min(max_length, 50))
+    
+    # Write the column headers with the defined format, then rows in order
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], header_format)
+    values = df.astype(object).where(df.notna(), None)
+    for row_num, row in enumerate(values.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_num, 0, row)
+    
+    workbook.close()
+    processed_data = output.getvalue()
+    return processed_data
+
+def convert_df_to_csv(df):
+    """Convert dataframe to UTF-8 CSV for download"""
+    return df.to_csv(index=False).encode('utf-8')
+
+def convert_df_to_parquet(df):
+    """Convert dataframe to Parquet for download"""
+    output = BytesIO()
+    df.to_parquet(output, index=False)
+    return output.getvalue()
+
+# Download formats: label -> (converter, file extension, MIME type)
+EXPORT_FORMATS = {
+    'Excel (.xlsx)': (convert_df_to_excel, 'xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'CSV (.csv)': (convert_df_to_csv, 'csv', 'text/csv'),
+    'Parquet (.parquet)': (convert_df_to_parquet, 'parquet', 'application/vnd.apache.parquet'),
+}
+
+def diff_grid_edits(stored, edited):
+    """Return changed cells between stored rows and grid data, both indexed by row ID
+
+    The result maps column -> Series of new values for only the rows whose
+    cell in that column differs; it is empty when nothing changed.
+    """
+    columns = [col for col in edited.columns if col != ROW_ID_COLUMN and col in stored.columns]
+    stored = logical_frame(stored.loc[edited.index, columns])
+    edited = logical_frame(edited[columns])
+    same = stored.eq(edited) | (stored.isna() & edited.isna())
+    changed = ~same.fillna(False).astype(bool)
+    return {
+        col: edited.loc[changed[col], col]
+        for col in columns
+        if changed[col].any()
+    }
+
+class SearchIndex:
+    """Trigram inverted index over the distinct values of the searchable text columns
+
+    Description and Model repeat across many rows, so the index is built over
+    distinct lower-cased field values rather than rows: every value has an
+    ID, each trigram's postings are the IDs of the values containing it
+    (slices of one sorted NumPy array), and each column holds one value ID
+    per row in an array indexed by row ID. A substring query is narrowed to
+    candidate values through the postings, only those are verified and
+    scored, and rows are ranked by their best field in one vectorized lookup.
+
+    Values added after the build go into a small delta that ``copy()``
+    duplicates; the built arrays are never modified, so copies share them.
+    Values no row refers to any more are left in place (they match no rows)
+    until the delta outgrows ``FOLD_MIN`` and the index is rebuilt from the
+    values still in use.
+    """
+
+    COLUMNS = ['Description', 'SN/Lot', 'Model']
+    FOLD_MIN = 1024
+
+    def __init__(self, df):
+        fields = pd.concat([pd.Series([''], dtype='string')] + [self._lower(df[col]) for col in self.COLUMNS],
+                           ignore_index=True)
+        # Value ID 0 is the empty field, also used for row IDs without a row
+        codes, values = pd.factorize(fields)
+        labels = df.index.to_numpy(dtype='int64')
+        self._rows = np.zeros((len(self.COLUMNS), labels.max() + 1 if len(labels) > 0 else 0), dtype=np.int32)
+        self._rows[:, labels] = codes[1:].reshape(len(self.COLUMNS), len(labels))
+        self._build(values.array)
+
+    @staticmethod
+    def _lower(values):
+        return values.astype('string').fillna('').str.lower()
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def _build(self, values):
+        """Postings of ``values`` (value ID -> lower-cased text) as sorted arrays, with an empty delta"""
+        grams = {}
+        gram_ids, value_ids = array('i'), array('i')
+        for value_id, value in enumerate(values):
+            for gram in self._trigrams(value):
+                gram_ids.append(grams.setdefault(gram, len(grams)))
+                value_ids.append(value_id)
+        gram_ids = np.frombuffer(gram_ids, dtype=np.int32)
+        self._values = values
+        self._grams = grams
+        self._postings = np.frombuffer(value_ids, dtype=np.int32)[np.argsort(gram_ids, kind='stable')]
+        self._offsets = np.concatenate([[0], np.cumsum(np.bincount(gram_ids, minlength=len(grams)))])
+        lengths = pd.Series(values).str.len().to_numpy()
+        self._short_values = np.flatnonzero((lengths > 0) & (lengths < 3)).astype(np.int32)
+        self._delta_ids = {}
+        self._delta_values = []
+        self._delta_postings = {}
+        self._delta_short = []
+
+    def copy(self):
+        """Index over the same rows that can be updated without changing this one"""
+        index = copy.copy(self)
+        index._rows = self._rows.copy()
+        index._delta_ids = dict(self._delta_ids)
+        index._delta_values = list(self._delta_values)
+        index._delta_postings = {gram: list(ids) for gram, ids in self._delta_postings.items()}
+        index._delta_short = list(self._delta_short)
+        return index
+
+    def memory_usage(self, like=None):
+        """Approximate bytes held by the index
+
+        The built postings, values and trigram table are left out when they
+        are the same arrays as those of index ``like`` (e.g. the snapshot's
+        index this one was copied from).
+        """
+        size = (self._rows.nbytes + _dict_bytes(self._delta_ids) + sys.getsizeof(self._delta_values)
+                + _dict_bytes(self._delta_postings) + sum(map(sys.getsizeof, self._delta_postings.values()))
+                + sys.getsizeof(self._delta_short))
+        if like is None or like._postings is not self._postings:
+            size += (self._postings.nbytes + self._offsets.nbytes + self._short_values.nbytes
+                     + int(pd.Series(self._values, copy=False).memory_usage(deep=True, index=False))
+                     + _dict_bytes(self._grams))
+        return size
+
+    def _value_id(self, value):
+        """ID of a lower-cased field value, adding it to the delta if it is new there"""
+        if not value:
+            return 0
+        value_id = self._delta_ids.get(value)
+        if value_id is None:
+            value_id = self._delta_ids[value] = len(self._values) + len(self._delta_values)
+            self._delta_values.append(value)
+            for gram in self._trigrams(value):
+                self._delta_postings.setdefault(gram, []).append(value_id)
+            if len(value) < 3:
+                self._delta_short.append(value_id)
+        return value_id
+
+    def add(self, rows):
+        """Index rows (or re-index edited ones), keyed by their row label"""
+        if rows.empty:
+            return
+        labels = rows.index.to_numpy(dtype='int64')
+        if labels.max() >= self._rows.shape[1]:
+            # Room for the following row IDs too, so appending one row at a time doesn't copy every time
+            grown = np.zeros((len(self.COLUMNS), max(labels.max() + 1, self._rows.shape[1] * 5 // 4)), dtype=np.int32)
+            grown[:, :self._rows.shape[1]] = self._rows
+            self._rows = grown
+        for i, col in enumerate(self.COLUMNS):
+            self._rows[i, labels] = [self._value_id(value) for value in self._lower(rows[col])]
+        if len(self._delta_values) > max(self.FOLD_MIN, len(self._values) // 2):
+            self._fold()
+
+    def remove(self, labels):
+        """Drop rows from the index"""
+        labels = np.asarray(labels, dtype='int64')
+        self._rows[:, labels[labels < self._rows.shape[1]]] = 0
+
+    def _fold(self):
+        """Rebuild the arrays from the values rows still use, emptying the delta"""
+        used = np.union1d([0], self._rows)
+        codes, values = pd.factorize(pd.Series(self._texts(used), dtype='string'))
+        remap = np.zeros(len(self._values) + len(self._delta_values), dtype=np.int32)
+        remap[used] = codes
+        self._rows = remap[self._rows]
+        self._build(values.array)
+
+    def _texts(self, value_ids):
+        """Text of sorted value IDs"""
+        built = np.searchsorted(value_ids, len(self._values))
+        texts = self._values.take(value_ids[:built]).tolist()
+        texts.extend(self._delta_values[value_id - len(self._values)] for value_id in value_ids[built:].tolist())
+        return texts
+
+    def _gram_postings(self, gram):
+        """Sorted IDs of the values containing a trigram"""
+        postings = np.empty(0, dtype=np.int32)
+        gram_id = self._grams.get(gram)
+        if gram_id is not None:
+            postings = self._postings[self._offsets[gram_id]:self._offsets[gram_id + 1]]
+        delta = self._delta_postings.get(gram)
+        if delta:
+            postings = np.concatenate([postings, np.array(delta, dtype=np.int32)])
+        return postings
+
+    def _candidates(self, query):
+        """Sorted IDs of the values that may contain ``query``"""
+        if len(query) >= 3:
+            postings = sorted((self._gram_postings(gram) for gram in self._trigrams(query)), key=len)
+            candidates = postings[0]
+            for other in postings[1:]:
+                if len(candidates) == 0:
+                    break
+                candidates = np.intersect1d(candidates, other, assume_unique=True)
+            return candidates
+        # Queries shorter than a trigram match through any gram containing them
+        grams = [gram for gram in set(self._grams).union(self._delta_postings) if query in gram]
+        return np.unique(np.concatenate([self._short_values, np.array(self._delta_short, dtype=np.int32)]
+                                        + [self._gram_postings(gram) for gram in grams]))
+
+    @staticmethod
+    def _score(value, query, word_start):
+        """Rank a field value: exact > prefix > word start > substring, 0 if no match"""
+        pos = value.find(query)
+        if pos < 0:
+            return 0
+        if value == query:
+            return 4
+        if pos == 0:
+            return 3
+        if word_start.search(value):
+            return 2
+        return 1
+
+    def search(self, query, limit=None):
+        """Return (ranked row labels, total match count) for a substring query"""
+        query = query.lower()
+        if not query:
+            return [], 0
+        candidates = self._candidates(query)
+        if len(candidates) == 0:
+            return [], 0
+        word_start = re.compile(r'(?<!\w)' + re.escape(query))
+        scores = np.zeros(len(self._values) + len(self._delta_values), dtype=np.int8)
+        scores[candidates] = [self._score(value, query, word_start) for value in self._texts(candidates)]
+        # Each row scores as its best field; ties keep row ID order
+        best = scores[self._rows].max(axis=0)
+        labels = np.flatnonzero(best)
+        labels = labels[np.argsort(-best[labels], kind='stable')]
+        if limit is not None:
+            labels = labels[:limit]
+        return labels.tolist(), int(np.count_nonzero(best))
+
+def image_url_mask(urls):
+    """Boolean mask of Image_URL values that hold a URL: not missing, blank or 'nan'"""
+    if isinstance(urls.dtype, pd.CategoricalDtype):
+        # Check each distinct URL once
+        holds_url = image_url_mask(pd.Series(urls.cat.categories)).to_numpy(bool)
+        codes = urls.cat.codes.to_numpy()
+        return pd.Series(np.where(codes >= 0, holds_url[codes], False), index=urls.index)
+    urls = urls.astype('string').fillna('').str.strip()
+    return (urls != '') & (urls != 'nan')
+
+def normalize_sn(values):
+    """SN/Lot values as compared when matching rows: surrounding spaces dropped, upper case"""
+    return values.astype('string').fillna('').str.strip().str.upper()
+
+class SerialIndex:
+    """Hash index of normalized SN/Lot -> row labels (in insertion order)
+
+    Rows with a blank SN/Lot are not indexed. ``copy()`` shares the
+    per-serial label dicts until either side changes one.
+    """
+
+    def __init__(self, df):
+        self._rows = {}
+        self._serials = {}
+        # Serials whose label dict this index may modify in place; None for all of them
+        self._owned = None
+        self.add(df)
+
+    def copy(self):
+        """Index over the same rows that can be updated without changing this one"""
+        index = copy.copy(self)
+        index._rows = dict(self._rows)
+        index._serials = dict(self._serials)
+        index._owned = set()
+        self._owned = set()
+        return index
+
+    def _own(self, serial):
+        """Label dict of ``serial`` that is safe to modify"""
+        rows = self._rows[serial]
+        if self._owned is not None and serial not in self._owned:
+            rows = self._rows[serial] = dict(rows)
+            self._owned.add(serial)
+        return rows
+
+    def add(self, rows):
+        """Index rows, keyed by their row label"""
+        for label, serial in zip(rows.index, normalize_sn(rows['SN/Lot'])):
+            if serial:
+                if serial in self._rows:
+                    self._own(serial)[label] = None
+                else:
+                    self._rows[serial] = {label: None}
+                    if self._owned is not None:
+                        self._owned.add(serial)
+                self._serials[label] = serial
+
+    def remove(self, labels):
+        """Drop rows from the index"""
+        for label in labels:
+            serial = self._serials.pop(label, None)
+            if serial is None:
+                continue
+            rows = self._own(serial)
+            rows.pop(label, None)
+            if not rows:
+                del self._rows[serial]
+
+    def get(self, serial):
+        """Row labels whose SN/Lot normalizes to ``serial`` (already normalized)"""
+        return list(self._rows.get(serial, ()))
+
+    def memory_usage(self, like=None):
+        """Approximate bytes held by the index, leaving out label dicts still shared with index ``like``"""
+        shared = like._rows if like is not None else {}
+        return (_dict_bytes(self._rows) + sys.getsizeof(self._serials)
+                + sum(_dict_bytes(rows) for serial, rows in self._rows.items() if shared.get(serial) is not rows))
+
+class RowIdAllocator:
+    """Thread-safe source of unique row IDs, shared by a snapshot and all its forks"""
+
+    def __init__(self, next_id=0):
+        self._lock = threading.Lock()
+        self._next_id = next_id
+
+    @property
+    def next_id(self):
+        return self._next_id
+
+    def allocate(self, count):
+        """Hand out ``count`` new row IDs"""
+        with self._lock:
+            start = self._next_id
+            self._next_id += count
+            return list(range(start, start + count))
+
+    def reserve(self, row_id):
+        """Make sure ``row_id`` is never handed out"""
+        with self._lock:
+            self._next_id = max(self._next_id, row_id + 1)
+
+class InventoryStore:
+    """Inventory DataFrame with an incrementally maintained location index
+
+    Rows are labelled by their ``ROW_ID_COLUMN`` value for their whole
+    lifetime, so the location -> row labels index and the per-location counts
+    can be updated in place on add/edit/delete instead of rescanning the frame.
+
+    A store published as a shared snapshot is ``read_only``; sessions edit a
+    ``fork()`` of it instead. Every write is also recorded in
+    ``pending_changes`` (see ``apply_change``) until it is saved to the
+    journal; added rows and updated cells are kept as a DataFrame / Series
+    per write, not per-row dicts, so a large import isn't held twice over
+    in Python objects. ``row_stamps`` maps row ID -> snapshot version
+    that last changed the row (0 if unchanged since load) for optimistic
+    concurrency checks in ``merge_changes``. ``generation`` counts how often
+    the shared snapshot was replaced wholesale (e.g. reloaded from GitHub);
+    row IDs of different generations do not refer to the same items.
+    Per-location row counts, unit sums and image counts are kept
+    materialized for the statistics sidebar.
+    """
+
+    def __init__(self, df, next_row_id=None):
+        if ROW_ID_COLUMN not in df.columns:
+            df = df.assign(**{ROW_ID_COLUMN: range(len(df))})
+        self.df = df.set_index(ROW_ID_COLUMN, drop=False).rename_axis(None)
+        if not self.df.index.is_unique:
+            raise ValueError(f"Duplicate values in {ROW_ID_COLUMN}")
+        self.row_ids = RowIdAllocator(int(self.df.index.max()) + 1 if len(self.df) > 0 else 0)
+        if next_row_id is not None:
+            self.row_ids.reserve(next_row_id - 1)
+        self._location_rows = {}
+        for location, labels in self.df.groupby('Location', sort=False, observed=True).groups.items():
+            self._location_rows[location] = dict.fromkeys(labels)
+        self._location_totals = {}
+        self._aggregate(self.df, 1)
+        self._search_index = None
+        self._search_index_shared = False
+        self._serial_index = None
+        self._serial_index_shared = False
+        self._index_lock = threading.Lock()
+        self._export_cache = {}
+        self.version = 0
+        self.generation = 0
+        self.read_only = False
+        self.snapshot_version = None
+        self.pending_changes = []
+        self.base = None
+        self.row_stamps = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def count(self, location):
+        """Number of rows stored at a location"""
+        return len(self._location_rows.get(location, ()))
+
+    def counts(self):
+        """Mapping of location -> number of rows"""
+        return {location: len(rows) for location, rows in self._location_rows.items()}
+
+    def location_stats(self):
+        """Mapping of location -> (rows, total units, rows with an image)"""
+        return {
+            location: (len(self._location_rows.get(location, ())), units, images)
+            for location, (units, images) in self._location_totals.items()
+        }
+
+    def memory_breakdown(self):
+        """Approximate bytes held by the store, by part
+
+        Besides the frame this counts the search and SN/Lot indexes (once
+        built), the location index and totals that every fork copies,
+        ``row_stamps`` and cached exports. A fork's indexes count only what
+        it does not share with the snapshot it was forked from.
+        """
+        base = self.base if not self.read_only else None
+        parts = {
+            'frame': int(self.df.memory_usage(deep=True).sum()),
+            'search_index': 0,
+            'serial_index': 0,
+            'location_index': (_dict_bytes(self._location_rows) + sum(map(_dict_bytes, self._location_rows.values()))
+                               + sys.getsizeof(self._location_totals)
+                               + sum(map(sys.getsizeof, self._location_totals.values()))),
+            'row_stamps': _dict_bytes(self.row_stamps),
+            'exports': sum(len(data) for _, data in self._export_cache.values()),
+        }
+        if self._search_index is not None and not self._search_index_shared:
+            parts['search_index'] = self._search_index.memory_usage(base._search_index if base is not None else None)
+        if self._serial_index is not None and not self._serial_index_shared:
+            parts['serial_index'] = self._serial_index.memory_usage(base._serial_index if base is not None else None)
+        return parts
+
+    def memory_usage(self):
+        """Approximate bytes held by the store (see memory_breakdown)"""
+        return sum(self.memory_breakdown().values())
+
+    def location_labels(self, location):
+        """Row labels stored at a location, in insertion order"""
+        return list(self._location_rows.get(location, ()))
+
+    def location_data(self, location):
+        """Rows stored at a location"""
+        return self.df.loc[self.location_labels(location)]
+
+    @property
+    def search_index(self):
+        """Search index over this data version, built once on first use (see _new_index)"""
+        if self._search_index is None:
+            with self._index_lock:
+                if self._search_index is None:
+                    base = self.base.search_index if self._forked_from_snapshot() else None
+                    self._search_index, self._search_index_shared = self._new_index(SearchIndex, base)
+        return self._search_index
+
+    @property
+    def serial_index(self):
+        """SN/Lot index over this data version, built once on first use (see _new_index)"""
+        if self._serial_index is None:
+            with self._index_lock:
+                if self._serial_index is None:
+                    base = self.base.serial_index if self._forked_from_snapshot() else None
+                    self._serial_index, self._serial_index_shared = self._new_index(SerialIndex, base)
+        return self._serial_index
+
+    def _forked_from_snapshot(self):
+        return self.base is not None and self.base.read_only
+
+    def _new_index(self, index_class, base_index):
+        """Return (index over this store, whether it is ``base_index`` itself)
+
+        A fork of a snapshot starts from the snapshot's index (``base_index``),
+        so concurrent sessions build each index once: it is shared until the
+        fork's own edits have to be applied to a copy of it.
+        """
+        if base_index is None:
+            return index_class(self.df), False
+        touched = pd.Index(list(_changed_row_ids(self.pending_changes)), dtype='int64').unique()
+        if touched.empty:
+            return base_index, True
+        index = base_index.copy()
+        index.remove(touched)
+        index.add(self.df.loc[touched.intersection(self.df.index)])
+        return index, False
+
+    def find_serials(self, serials):
+        """Mapping of each normalized SN/Lot in ``serials`` -> row labels holding it"""
+        index = self.serial_index
+        return {serial: index.get(serial) for serial in serials}
+
+    def search(self, query, limit=None):
+        """Return (ranked matching rows, total match count)"""
+        labels, total = self.search_index.search(query, limit)
+        return self.df.loc[labels], total
+
+    def export(self, fmt):
+        """Export bytes in one of EXPORT_FORMATS, rebuilt only when the data version changed"""
+        cached = self._export_cache.get(fmt)
+        if cached is None or cached[0] != self.version:
+            converter = EXPORT_FORMATS[fmt][0]
+            cached = (self.version, converter(logical_frame(self.df.drop(columns=ROW_ID_COLUMN))))
+            self._export_cache[fmt] = cached
+        return cached[1]
+
+    def fork(self):
+        """Writable copy for a session's own edits
+
+        The search and SN/Lot indexes and the export cache are shared with this
+        store until the fork's first write, which takes copies of the indexes
+        (see SearchIndex.copy) and updates those incrementally. A fork of a
+        snapshot whose indexes aren't built yet builds them on the snapshot.
+        """
+        fork = copy.copy(self)
+        fork.df = self.df.copy()
+        fork._location_rows = {location: dict(rows) for location, rows in self._location_rows.items()}
+        fork._location_totals = {location: list(totals) for location, totals in self._location_totals.items()}
+        fork._search_index_shared = self._search_index is not None
+        fork._serial_index_shared = self._serial_index is not None
+        fork._index_lock = threading.Lock()
+        fork._export_cache = dict(self._export_cache)
+        fork.read_only = False
+        fork.pending_changes = []
+        fork.base = self
+        return fork
+
+    def _begin_write(self):
+        if self.read_only:
+            raise RuntimeError("Inventory snapshot is read-only; edit a fork() of it instead")
+        if self._search_index_shared:
+            self._search_index = self._search_index.copy()
+            self._search_index_shared = False
+        if self._serial_index_shared:
+            self._serial_index = self._serial_index.copy()
+            self._serial_index_shared = False
+
+    def _aggregate(self, rows, sign):
+        """Add (sign=1) or remove (sign=-1) rows from the per-location unit and image totals"""
+        if rows.empty:
+            return
+        totals = pd.DataFrame({
+            'Location': rows['Location'],
+            'Unit': rows['Unit'],
+            'Images': image_url_mask(rows['Image_URL'])
+        }).groupby('Location', sort=False, observed=True)[['Unit', 'Images']].sum()
+        for location, units, images in totals.itertuples():
+            location_totals = self._location_totals.setdefault(location, [0, 0])
+            location_totals[0] += sign * int(units)
+            location_totals[1] += sign * int(images)
+            # Locations whose last row was removed drop out of the totals
+            if location not in self._location_rows:
+                del self._location_totals[location]
+
+    def _storage_values(self, col, values):
+        """``values`` in the stored dtype of ``col``, adding any new categories to the column first"""
+        dtype = self.df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            new = pd.Index(values.unique()).difference(dtype.categories).dropna()
+            if len(new) > 0:
+                self.df[col] = self.df[col].cat.add_categories(new)
+                dtype = self.df[col].dtype
+        return values.astype(dtype)
+
+    def _index_rows(self, labels, locations):
+        for label, location in zip(labels, locations):
+            self._location_rows.setdefault(location, {})[label] = None
+
+    def _unindex_rows(self, labels, locations):
+        for label, location in zip(labels, locations):
+            rows = self._location_rows.get(location)
+            if rows is not None:
+                rows.pop(label, None)
+                if not rows:
+                    del self._location_rows[location]
+
+    def add_rows(self, rows):
+        """Validate rows and append the valid ones under new row IDs
+
+        Returns ``(row IDs, issues)`` as described in validate_inventory_rows.
+        """
+        rows, issues = validate_inventory_rows(rows)
+        if rows.empty:
+            return [], issues
+        labels = self.row_ids.allocate(len(rows))
+        self._insert_rows(rows.assign(**{ROW_ID_COLUMN: labels}))
+        return labels, issues
+
+    def _insert_rows(self, rows):
+        self._begin_write()
+        labels = rows[ROW_ID_COLUMN].tolist()
+        rows = rows.set_axis(labels)
+        self.row_ids.reserve(max(labels))
+        if len(self.df) > 0:
+            rows = rows.assign(**{col: self._storage_values(col, rows[col]) for col in STORAGE_SCHEMA})
+            self.df = pd.concat([self.df, rows])
+        else:
+            self.df = rows
+        self._index_rows(labels, rows['Location'])
+        self._aggregate(rows, 1)
+        if self._search_index is not None:
+            self._search_index.add(rows)
+        if self._serial_index is not None:
+            self._serial_index.add(rows)
+        self.pending_changes.append({'op': 'add', 'rows': rows})
+        self.version += 1
+
+    def update_cells(self, changes):
+        """Write changed cells; ``changes`` maps column -> Series of new values indexed by row ID"""
+        self._begin_write()
+        labels = pd.Index([])
+        for values in changes.values():
+            labels = labels.union(values.index)
+        reaggregate = any(col in changes for col in ('Location', 'Unit', 'Image_URL'))
+        if reaggregate:
+            old_rows = self.df.loc[labels]
+        if 'Location' in changes:
+            moved = changes['Location'].index
+            self._unindex_rows(moved, self.df.loc[moved, 'Location'])
+        changes = {col: values.astype(INVENTORY_SCHEMA[col]) for col, values in changes.items()}
+        for col, values in changes.items():
+            self.df.loc[values.index, col] = self._storage_values(col, values)
+        if 'Location' in changes:
+            self._index_rows(moved, changes['Location'])
+        if reaggregate:
+            self._aggregate(old_rows, -1)
+            self._aggregate(self.df.loc[labels], 1)
+        if self._search_index is not None and any(col in changes for col in SearchIndex.COLUMNS):
+            self._search_index.remove(labels)
+            self._search_index.add(self.df.loc[labels])
+        if self._serial_index is not None and 'SN/Lot' in changes:
+            edited = changes['SN/Lot'].index
+            self._serial_index.remove(edited)
+            self._serial_index.add(self.df.loc[edited])
+        self.pending_changes.append({'op': 'update', 'changes': changes})
+        self.version += 1
+
+    def delete_rows(self, labels):
+        """Remove rows by row ID"""
+        labels = list(labels)
+        if not labels:
+            return
+        self._begin_write()
+        rows = self.df.loc[labels]
+        self._unindex_rows(labels, rows['Location'])
+        self.df = self.df.drop(index=labels)
+        self._aggregate(rows, -1)
+        if self._search_index is not None:
+            self._search_index.remove(labels)
+        if self._serial_index is not None:
+            self._serial_index.remove(labels)
+        self.pending_changes.append({'op': 'delete', 'ids': [int(label) for label in labels]})
+        self.version += 1
+
+    def apply_change(self, change):
+        """Apply one recorded change (an entry of ``pending_changes`` or a journal record)
+
+        Edits and deletes of rows that no longer exist are skipped, so changes
+        recorded against an older snapshot can be replayed on a newer one.
+        Added rows whose row ID is already in use are not inserted; their IDs
+        are returned so the caller can report them.
+        """
+        collisions = []
+        if change['op'] == 'add':
+            rows = _change_rows(change)
+            taken = rows[ROW_ID_COLUMN].isin(self.df.index)
+            collisions = rows.loc[taken, ROW_ID_COLUMN].tolist()
+            rows = rows[~taken]
+            if not rows.empty:
+                self._insert_rows(rows)
+        elif change['op'] == 'update':
+            changes = {}
+            for col, values in change['changes'].items():
+                values = _change_values(col, values)
+                values = values[values.index.isin(self.df.index)]
+                if not values.empty:
+                    changes[col] = values
+            if changes:
+                self.update_cells(changes)
+        elif change['op'] == 'delete':
+            self.delete_rows(self.df.index.intersection(change['ids']))
+        else:
+            raise ValueError(f"Unknown change op: {change['op']}")
+        return collisions
+
+    def merge_changes(self, changes, base):
+        """Three-way merge of a session's changes, made against ``base``, into this store
+
+        A row whose stamp still matches ``base`` was not changed by anyone
+        else and takes the change as-is. For a row changed concurrently, a
+        cell edit still merges when the other side left that cell alone (or
+        made the same edit); otherwise it is a conflict. Deleting a row that
+        someone else edited, or editing one they deleted, is also a conflict,
+        as is adding a row under a row ID that is already in use. Conflicting
+        changes are not applied.
+
+        Returns a DataFrame with one row per conflict (Row ID, Location,
+        Column, Your value, Current value, Problem).
+        """
+        conflicts = []
+
+        def changed_elsewhere(row_id):
+            return self.row_stamps.get(row_id, 0) != base.row_stamps.get(row_id, 0)
+
+        for change in changes:
+            if change['op'] == 'add':
+                collisions = self.apply_change(change)
+                if collisions:
+                    rows = _change_rows(change).set_index(ROW_ID_COLUMN, drop=False)
+                    for row_id in collisions:
+                        conflicts.append((row_id, rows.at[row_id, 'Location'], '', 'add',
+                                          self.df.at[row_id, 'Description'], 'row ID is already used by another item'))
+            elif change['op'] == 'delete':
+                deletable = []
+                for row_id in change['ids']:
+                    if row_id not in self.df.index:
+                        continue
+                    if changed_elsewhere(row_id):
+                        conflicts.append((row_id, self.df.at[row_id, 'Location'], '', 'delete',
+                                          'edited', 'row was edited by another user'))
+                    else:
+                        deletable.append(row_id)
+                self.delete_rows(deletable)
+            else:
+                merged = {}
+                for col, values in change['changes'].items():
+                    for row_id, value in _change_pairs(values):
+                        if row_id not in self.df.index:
+                            if row_id in base.df.index:
+                                conflicts.append((row_id, base.df.at[row_id, 'Location'], col, value,
+                                                  'deleted', 'row was deleted by another user'))
+                            continue
+                        current = self.df.at[row_id, col]
+                        if (changed_elsewhere(row_id) and row_id in base.df.index
+                                and current != base.df.at[row_id, col] and current != value):
+                            conflicts.append((row_id, self.df.at[row_id, 'Location'], col, value,
+                                              current, 'cell was changed by another user'))
+                        else:
+                            merged.setdefault(col, []).append((row_id, value))
+                if merged:
+                    self.apply_change({'op': 'update', 'changes': merged})
+
+        conflicts = pd.DataFrame(conflicts, columns=['Row ID', 'Location', 'Column', 'Your value', 'Current value', 'Problem'])
+        return conflicts.astype({'Your value': str, 'Current value': str})
+
+def read_import_chunks(source, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Yield the rows of an xlsx or CSV file as DataFrames of at most ``chunk_rows`` rows
+
+    ``source`` is a path or a file-like object with a ``name``. Workbooks are
+    read through openpyxl's read-only mode (first sheet) and CSVs with a
+    chunked reader, so only one chunk is held at a time. Cells are kept as
+    read for validate_inventory_rows; rows are labelled by their line in the
+    file (the header is line 1) and entirely blank rows are skipped.
+    """
+    name = str(getattr(source, 'name', source))
+    suffix = Path(name).suffix.lower()
+    if suffix == '.csv':
+        # Blank lines are read (and dropped below) so that row labels stay file line numbers
+        for chunk in pd.read_csv(source, chunksize=chunk_rows, dtype=str, keep_default_na=False,
+                                 skip_blank_lines=False):
+            chunk.columns = [str(col).strip() for col in chunk.columns]
+            chunk.index = chunk.index + 2
+            yield chunk[(chunk != '').any(axis=1)]
+    elif suffix in ('.xlsx', '.xlsm'):
+        workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(col).strip() if col is not None else '' for col in header]
+            batch, labels = [], []
+            for line, row in enumerate(rows, start=2):
+                if all(value is None or value == '' for value in row):
+                    continue
+                batch.append(row[:len(columns)])
+                labels.append(line)
+                if len(batch) == chunk_rows:
+                    yield pd.DataFrame(batch, columns=columns, index=labels)
+                    batch, labels = [], []
+            if batch:
+                yield pd.DataFrame(batch, columns=columns, index=labels)
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"{name}: unsupported file type (expected .xlsx or .csv)")
+
+class InventoryImport:
+    """Upsert of imported rows into a store, fed one chunk at a time
+
+    Rows are matched to stored rows by (normalized SN/Lot, Location). A
+    matched row has its changed cells updated, except SN/Lot, which keeps
+    its stored spelling; columns missing from the file are left as they are. Other rows, including all rows without an SN/Lot,
+    are inserted. Within a chunk the last row for a key wins. Invalid rows
+    are rejected as in validate_inventory_rows; up to ``max_issues`` of their
+    problems are kept in ``issues``.
+
+    ``editable``, if given, is called on the first write and returns the
+    store to write to from then on (e.g. a fork of a read-only ``store``),
+    so an import that changes nothing leaves ``store`` untouched.
+    """
+
+    def __init__(self, store, max_issues=IMPORT_MAX_ISSUES, editable=None):
+        self.store = store
+        self.max_issues = max_issues
+        self._editable = editable
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.issues = []
+
+    def _writable(self):
+        if self._editable is not None:
+            self.store = self._editable()
+            self._editable = None
+        return self.store
+
+    def _match(self, serial, location):
+        """First stored row with this normalized SN/Lot at ``location``, via the store's SN/Lot index"""
+        locations = self.store.df['Location']
+        for label in self.store.serial_index.get(serial):
+            if locations.at[label] == location:
+                return label
+        return None
+
+    def feed(self, chunk, source=''):
+        """Validate one chunk and upsert its valid rows"""
+        if 'Location' not in chunk.columns:
+            raise ValueError(f"{source}: no Location column")
+        columns = [col for col in INVENTORY_SCHEMA if col in chunk.columns]
+        chunk = chunk[columns].assign(**{col: '' for col in INVENTORY_SCHEMA if col not in chunk.columns})
+        valid, issues = validate_inventory_rows(chunk)
+        if not issues.empty:
+            self.rejected += issues['Row'].nunique()
+            room = self.max_issues - sum(len(frame) for frame in self.issues)
+            if room > 0:
+                self.issues.append(issues.head(room).assign(File=source))
+        if valid.empty:
+            return
+        
+        # Last row per key wins; rows without an SN/Lot are never matched
+        sn = normalize_sn(valid['SN/Lot'])
+        keyed = sn != ''
+        superseded = keyed & pd.DataFrame({'sn': sn, 'location': valid['Location']}).duplicated(keep='last')
+        self.duplicates += int(superseded.sum())
+        valid, sn = valid[~superseded], sn[~superseded]
+        matches = pd.Series([self._match(s, location) if s else None
+                             for s, location in zip(sn, valid['Location'])], index=valid.index, dtype=object)
+        
+        existing = valid[matches.notna()]
+        if not existing.empty:
+            # SN/Lot only matched after normalization, so the stored spelling is kept
+            updatable = [col for col in columns if col != 'SN/Lot']
+            incoming = existing[updatable].set_axis(matches[matches.notna()].astype('int64').to_numpy())
+            changes = diff_grid_edits(self.store.df, incoming)
+            changed = pd.Index([])
+            for values in changes.values():
+                changed = changed.union(values.index)
+            if changes:
+                self._writable().update_cells(changes)
+            self.updated += len(changed)
+            self.unchanged += len(existing) - len(changed)
+        
+        new = valid[matches.isna()]
+        if not new.empty:
+            labels, _ = self._writable().add_rows(new.reset_index(drop=True))
+            self.inserted += len(labels)
+
+    def summary(self):
+        """Counts of inserted, updated, unchanged, superseded and rejected rows"""
+        return {
+            'Inserted': self.inserted,
+            'Updated': self.updated,
+            'Unchanged': self.unchanged,
+            'Superseded in file': self.duplicates,
+            'Rejected': self.rejected,
+        }
+
+    def issues_frame(self):
+        if not self.issues:
+            return pd.DataFrame(columns=['File', 'Row', 'Column', 'Value', 'Problem'])
+        return pd.concat(self.issues, ignore_index=True)[['File', 'Row', 'Column', 'Value', 'Problem']]
+
+def parse_scanned_codes(text):
+    """Scanned SN/Lot codes from pasted text: one per line, or separated by commas, semicolons or tabs"""
+    return [code.strip() for code in re.split(r'[\r\n,;\t]+', text) if code.strip()]
+
+def reconcile_scans(store, codes, counted_locations=()):
+    """Reconciliation sheet of scanned SN/Lot codes against the stored rows
+
+    Codes are matched through the store's SN/Lot index after normalization
+    (see normalize_sn); repeated scans of a code are counted in ``Scans``.
+    There is one sheet row per (code, matching stored row) with Status
+    'Found', or 'Duplicate locations' when the code is stored at more than
+    one location, and one row with Status 'Missing' per unmatched code. Rows
+    stored at ``counted_locations`` whose SN/Lot was not scanned are added
+    with Status 'Not scanned'.
+    """
+    scans, first_seen = {}, {}
+    for code, serial in zip(codes, normalize_sn(pd.Series(codes, dtype='string'))):
+        if serial:
+            scans[serial] = scans.get(serial, 0) + 1
+            first_seen.setdefault(serial, code)
+    
+    records = []
+    locations = store.df['Location']
+    for serial, labels in store.find_serials(scans).items():
+        if not labels:
+            records.append((first_seen[serial], scans[serial], 'Missing', None))
+            continue
+        status = 'Duplicate locations' if len({locations.at[label] for label in labels}) > 1 else 'Found'
+        records.extend((first_seen[serial], scans[serial], status, label) for label in labels)
+    for location in counted_locations:
+        labels = store.location_labels(location)
+        serials = normalize_sn(store.df.loc[labels, 'SN/Lot'])
+        records.extend(('', 0, 'Not scanned', label) for label, serial in zip(labels, serials) if serial not in scans)
+    
+    sheet = pd.DataFrame(records, columns=['Scanned', 'Scans', 'Status', ROW_ID_COLUMN])
+    found = sheet[ROW_ID_COLUMN].dropna().astype('int64').unique()
+    items = logical_frame(store.df.loc[found, list(INVENTORY_SCHEMA)])
+    sheet = sheet.join(items, on=ROW_ID_COLUMN).drop(columns=ROW_ID_COLUMN)
+    return sheet.astype({'Unit': 'Int64'})
+
+def _change_rows(change):
+    """Added rows of an 'add' change as a DataFrame (journal records hold a list of row dicts)"""
+    rows = change['rows']
+    if isinstance(rows, pd.DataFrame):
+        return rows
+    return clean_dataframe_types(pd.DataFrame(rows))
+
+def _change_values(col, values):
+    """New values of one column of an 'update' change as a Series indexed by row ID"""
+    if isinstance(values, pd.Series):
+        return values
+    return pd.Series(dict(values), dtype=INVENTORY_SCHEMA[col])
+
+def _change_pairs(values):
+    """(row ID, new value) pairs of one column of an 'update' change"""
+    if isinstance(values, pd.Series):
+        return zip(values.index.tolist(), values.tolist())
+    return values
+
+def _journal_record(seq, change):
+    """JSON line of a recorded change, with added rows as row dicts and updates as (row ID, value) pairs"""
+    if change['op'] == 'add':
+        rows = _change_rows(change)
+        columns = list(rows.columns)
+        change = {**change, 'rows': [dict(zip(columns, row)) for row in zip(*(rows[col].tolist() for col in columns))]}
+    elif change['op'] == 'update':
+        change = {**change, 'changes': {col: list(_change_pairs(values)) for col, values in change['changes'].items()}}
+    return json.dumps({'seq': seq, **change}, default=_json_default)
+
+def _json_default(value):
+    # numpy scalars from DataFrame rows
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class InventoryJournal:
+    """Durable inventory storage: a snapshot plus an append-only change journal
+
+    Each saved add/edit/delete is appended to ``journal.jsonl`` as one JSON
+    record; a save's records share a single fsync. Startup loads the last
+    snapshot (SQLite or xlsx) and replays the records written after it. Once
+    ``compact_after`` records have accumulated, a background thread writes a
+    new snapshot and drops the records it covers from the journal.
+    ``reloaded_seq`` is the seq at which the inventory was last replaced by
+    a fresh workbook load; records after it are edits the workbook lacks.
+    """
+
+    def __init__(self, data_dir=INVENTORY_DATA_DIR, snapshot_format=SNAPSHOT_FORMAT,
+                 compact_after=JOURNAL_COMPACT_RECORDS):
+        if snapshot_format not in ('sqlite', 'xlsx'):
+            raise ValueError(f"Unsupported snapshot format: {snapshot_format}")
+        self.data_dir = Path(data_dir)
+        self.journal_path = self.data_dir / 'journal.jsonl'
+        self.snapshot_path = self.data_dir / f'snapshot.{snapshot_format}'
+        self.snapshot_format = snapshot_format
+        self.compact_after = compact_after
+        self.seq = 0
+        self.reloaded_seq = 0
+        self._snapshot_seq = 0
+        self._records_since_snapshot = 0
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+
+    def has_snapshot(self):
+        return self.snapshot_path.exists()
+
+    def _read_snapshot(self):
+        if self.snapshot_format == 'sqlite':
+            with closing(sqlite3.connect(self.snapshot_path)) as conn:
+                df = pd.read_sql('SELECT * FROM inventory', conn)
+                meta = dict(conn.execute('SELECT key, value FROM meta').fetchall())
+        else:
+            sheets = pd.read_excel(self.snapshot_path, sheet_name=['Inventory', 'Meta'])
+            df = sheets['Inventory']
+            meta = dict(zip(sheets['Meta']['key'], sheets['Meta']['value']))
+        return clean_dataframe_types(df), {key: int(value) for key, value in meta.items()}
+
+    def _write_snapshot(self, store, seq):
+        tmp_path = self.snapshot_path.with_name(self.snapshot_path.name + '.tmp')
+        tmp_path.unlink(missing_ok=True)
+        meta = pd.DataFrame({
+            'key': ['seq', 'next_row_id', 'reloaded_seq'],
+            'value': [seq, store.row_ids.next_id, self.reloaded_seq]
+        })
+        if self.snapshot_format == 'sqlite':
+            with closing(sqlite3.connect(tmp_path)) as conn:
+                store.df.to_sql('inventory', conn, index=False)
+                meta.to_sql('meta', conn, index=False)
+                conn.commit()
+        else:
+            # Cells are stored as plain text: no URL limit, and a leading '=' is not a formula
+            with pd.ExcelWriter(tmp_path, engine='xlsxwriter', engine_kwargs={
+                'options': {'strings_to_urls': False, 'strings_to_formulas': False}
+            }) as writer:
+                store.df.to_excel(writer, sheet_name='Inventory', index=False)
+                meta.to_excel(writer, sheet_name='Meta', index=False)
+        _replace_synced(tmp_path, self.snapshot_path)
+
+    def _read_records(self):
+        try:
+            lines = self.journal_path.read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError:
+            return []
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A torn final write from a crash; everything before it is intact
+                break
+        return records
+
+    def load(self):
+        """Rebuild the saved inventory, or return None if nothing was saved yet"""
+        if not self.has_snapshot():
+            return None
+        df, meta = self._read_snapshot()
+        store = InventoryStore(df, next_row_id=meta.get('next_row_id'))
+        self.seq = self._snapshot_seq = meta.get('seq', 0)
+        self.reloaded_seq = meta.get('reloaded_seq', 0)
+        for record in self._read_records():
+            if record['seq'] > self.seq:
+                collisions = store.apply_change(record)
+                if collisions:
+                    logger.warning("Journal record %d adds rows whose IDs are already in use; skipped %s",
+                                   record['seq'], collisions)
+                self.seq = record['seq']
+                self._records_since_snapshot += 1
+        store.pending_changes = []
+        return store
+
+    def append(self, changes, sync=True):
+        """Append changes, with one fsync for the whole batch; returns the last record's seq
+
+        With ``sync=False`` the records are written but not fsynced; call
+        ``sync()`` afterwards, outside any lock held by the caller.
+        """
+        if not changes:
+            return self.seq
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            # Records are serialized one at a time, so a large import is never held as JSON all at once
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                for change in changes:
+                    self.seq += 1
+                    f.write(_journal_record(self.seq, change) + '\n')
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+            self._records_since_snapshot += len(changes)
+            return self.seq
+
+    def sync(self):
+        """fsync the journal; one call covers every record written before it"""
+        _fsync_path(self.journal_path)
+
+    def compact(self, store, reloaded=False):
+        """Write ``store`` (which must include every appended change) as the new snapshot
+
+        ``reloaded`` marks ``store`` as a fresh workbook load that replaces
+        everything saved before it.
+        """
+        with self._compact_lock:
+            if reloaded:
+                self.reloaded_seq = self.seq
+            self._compact(store, self.seq)
+
+    def saved_changes(self):
+        """Number of changes saved since the inventory was last loaded from the workbook"""
+        return self.seq - self.reloaded_seq
+
+    def maybe_compact(self, store, seq):
+        """Compact in a background thread once enough records have accumulated
+
+        ``store`` must include exactly the records up to ``seq`` (as returned
+        by ``append``); records appended after it are kept in the journal.
+        """
+        if self._records_since_snapshot < self.compact_after or not self._compact_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._compact(store, seq)
+            finally:
+                self._compact_lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _compact(self, store, seq):
+        if seq < self._snapshot_seq:
+            # A newer snapshot was written already; this one would bring back dropped records
+            return
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+        # The snapshot is on disk before the journal records it covers are dropped
+        self._write_snapshot(store, seq)
+        self._snapshot_seq = seq
+        with self._lock:
+            # Keep records appended while the snapshot was being written
+            remaining = [record for record in self._read_records() if record['seq'] > seq]
+            data = ''.join(json.dumps(record, default=_json_default) + '\n' for record in remaining)
+            _write_atomic(self.journal_path, data.encode('utf-8'))
+            self._records_since_snapshot = len(remaining)
+
+class SharedInventory:
+    """Process-wide inventory snapshot shared by every session
+
+    Sessions read the published, read-only snapshot without copying it. A
+    session that edits works on its own fork (copy-on-write) and publishes it
+    back with ``publish``, which bumps the snapshot version so other sessions
+    can pull it. Published changes are written to the journal, if one is given.
+    ``saved_changes`` counts the changes published since the inventory was
+    last loaded from the workbook (kept across restarts by the journal).
+    """
+
+    def __init__(self, store, journal=None):
+        self._lock = threading.Lock()
+        self.version = 0
+        self.saved_changes = journal.saved_changes() if journal is not None else 0
+        store.read_only = True
+        store.snapshot_version = 0
+        self._store = store
+        self.journal = journal
+
+    def snapshot(self):
+        """Return (read-only store, snapshot version)"""
+        with self._lock:
+            return self._store, self.version
+
+    def publish(self, store, replace=False, discard_saved=False):
+        """Publish a session's edits; returns (new snapshot version, conflicts)
+
+        Saves are optimistic: if another session published since ``store``
+        was forked, its changes are merged onto the current snapshot with
+        ``merge_changes`` outside the lock, and the lock is only held to
+        check that nothing else was published meanwhile (retrying if it
+        was), write the journal records and swap the snapshot. The journal
+        fsync happens after the lock is released.
+
+        With ``replace`` the store becomes the snapshot as-is (e.g. after
+        reloading from GitHub) and starts a new generation. It takes over the
+        shared row ID allocator so rows added by forks of either generation
+        never share an ID. Edits made on forks of an earlier generation refer
+        to rows by IDs that no longer identify the same items, so none of
+        them are applied: they are all returned as conflicts and the snapshot
+        is left unchanged. A replace discards every saved change, so it raises
+        RuntimeError while ``saved_changes`` is non-zero unless
+        ``discard_saved`` is given.
+        """
+        conflicts = pd.DataFrame()
+        while True:
+            current, version = self.snapshot()
+            candidate = store
+            if not replace and store.generation != current.generation:
+                return version, _reloaded_conflicts(store.pending_changes)
+            if not replace and store.snapshot_version != version:
+                candidate = current.fork()
+                conflicts = candidate.merge_changes(store.pending_changes, store.base)
+            
+            with self._lock:
+                if self.version != version:
+                    continue
+                if replace and self.saved_changes and not discard_saved:
+                    raise RuntimeError(
+                        f"{self.saved_changes} saved change(s) are not in the reloaded data; "
+                        "pass discard_saved=True to discard them"
+                    )
+                if replace:
+                    current.row_ids.reserve(candidate.row_ids.next_id - 1)
+                    candidate.row_ids = current.row_ids
+                if self.journal is not None:
+                    if replace:
+                        self.journal.compact(candidate, reloaded=True)
+                    else:
+                        if not self.journal.has_snapshot():
+                            self.journal.compact(current)
+                        seq = self.journal.append(candidate.pending_changes, sync=False)
+                self.version += 1
+                if replace:
+                    candidate.generation = current.generation + 1
+                    candidate.row_stamps = {}
+                    self.saved_changes = 0
+                else:
+                    self.saved_changes += len(candidate.pending_changes)
+                    candidate.row_stamps = dict(current.row_stamps)
+                    for row_id in _changed_row_ids(candidate.pending_changes):
+                        candidate.row_stamps[row_id] = self.version
+                candidate.pending_changes = []
+                candidate.base = None
+                candidate.read_only = True
+                candidate.snapshot_version = self.version
+                self._store = candidate
+                new_version = self.version
+            break
+        
+        if self.journal is not None and not replace:
+            self.journal.sync()
+            self.journal.maybe_compact(candidate, seq)
+        return new_version, conflicts
+
+def _reloaded_conflicts(changes):
+    """Conflicts (as in merge_changes) for every change made before the snapshot was replaced"""
+    problem = 'inventory was reloaded from GitHub after this change was made'
+    conflicts = []
+    for change in changes:
+        if change['op'] == 'add':
+            rows = _change_rows(change)
+            conflicts.extend((row_id, location, '', 'add', '', problem)
+                             for row_id, location in zip(rows[ROW_ID_COLUMN].tolist(), rows['Location'].tolist()))
+        elif change['op'] == 'delete':
+            conflicts.extend((row_id, '', '', 'delete', '', problem) for row_id in change['ids'])
+        else:
+            for col, values in change['changes'].items():
+                conflicts.extend((row_id, '', col, value, '', problem) for row_id, value in _change_pairs(values))
+    conflicts = pd.DataFrame(conflicts, columns=['Row ID', 'Location', 'Column', 'Your value', 'Current value', 'Problem'])
+    return conflicts.astype({'Your value': str, 'Current value': str})
+
+def _changed_row_ids(changes):
+    """Row IDs touched by a list of recorded changes"""
+    for change in changes:
+        if change['op'] == 'add':
+            yield from _change_rows(change)[ROW_ID_COLUMN].tolist()
+        elif change['op'] == 'delete':
+            yield from change['ids']
+        else:
+            for values in change['changes'].values():
+                yield from (row_id for row_id, _ in _change_pairs(values))
+
+def open_inventory(data_dir=INVENTORY_DATA_DIR):
+    """Inventory store from the saved journal in ``data_dir``, or freshly loaded from the workbook"""
+    store = InventoryJournal(data_dir).load()
+    if store is None:
+        store = InventoryStore(load_inventory_frame()[0])
+    return store
+
+@functools.lru_cache(maxsize=None)
+def load_shelf_layout(path=SHELF_LAYOUT_FILE):
+    """Rooms, shelves and layers from the shelf layout config file
+
+    Returns ``{'layer_positions': {layer: label}, 'rooms': [...]}``; each
+    room gets a ``locations`` list of (shelf, layer, location), top layer
+    first, where location is the shelf name followed by the layer number.
+    Location names must be unique across rooms.
+    """
+    config = json.loads(Path(path).read_text(encoding='utf-8'))
+    seen = set()
+    rooms = []
+    for room in config['rooms']:
+        locations = []
+        for shelf in room['shelves']:
+            for layer in sorted(shelf['layers'], reverse=True):
+                location = f"{shelf['name']}{layer}"
+                if location in seen:
+                    raise ValueError(f"Location {location} appears more than once in {path}")
+                seen.add(location)
+                locations.append((shelf['name'], layer, location))
+        rooms.append({
+            'name': room['name'],
+            'image': room.get('image'),
+            'shelves': room['shelves'],
+            'locations': locations
+        })
+    return {
+        'layer_positions': {int(layer): label for layer, label in config.get('layer_positions', {}).items()},
+        'rooms': rooms
+    }
+
+def layer_position(layer):
+    """Position label of a layer number, e.g. 'Top'"""
+    return load_shelf_layout()['layer_positions'].get(int(layer), f"Layer {layer}")
+
+def location_layer_position(location):
+    """Position label of a location's layer, from its trailing layer number"""
+    match = re.search(r'(\d+)$', location)
+    return layer_position(match.group(1)) if match else "Unknown"
@@ -0,0 +1,145 @@
+"""Gallery thumbnails: a bounded fetch pool in front of a size-capped disk cache
+
+Kept free of Streamlit, like inventory_core, so it can run and be tested on
+its own; streamlit_app.py shares one ThumbnailService across sessions.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+from pathlib import Path
+
+import requests
+from PIL import Image
+
+# Thumbnail disk cache (size-capped LRU), fetch pool, per-request timeouts,
+# how long a rerun waits for thumbnails and how long failed URLs are skipped
+IMAGE_CACHE_DIR = Path(os.environ.get('INVENTORY_IMAGE_CACHE_DIR', Path(__file__).with_name('.image_cache')))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('INVENTORY_IMAGE_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+IMAGE_THUMBNAIL_SIZE = (600, 600)
+IMAGE_FETCH_WORKERS = 8
+IMAGE_FETCH_TIMEOUT = (5, 15)
+IMAGE_RENDER_WAIT_SECONDS = 10
+IMAGE_FAILURE_TTL_SECONDS = 600
+
+def _write_atomic(path, data):
+    """Replace ``path`` with ``data`` so readers never see a partial file
+
+    Not fsynced: a thumbnail lost in a crash is simply fetched again.
+    """
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+class ThumbnailService:
+    """Gallery thumbnails fetched through a bounded thread pool into a disk cache
+
+    Each image URL is downloaded at most once at a time, downscaled to
+    ``thumbnail_size`` and stored as a JPEG in ``cache_dir``. The cache is
+    an LRU capped at ``max_bytes``. URLs that fail to download or decode are
+    remembered for ``failure_ttl`` seconds and not retried until then.
+    """
+
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES,
+                 thumbnail_size=IMAGE_THUMBNAIL_SIZE, max_workers=IMAGE_FETCH_WORKERS,
+                 timeout=IMAGE_FETCH_TIMEOUT, failure_ttl=IMAGE_FAILURE_TTL_SECONDS):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self.timeout = timeout
+        self.failure_ttl = failure_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thumbnail')
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._failures = {}
+        # LRU of cached files (least recently used first) -> size in bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        files = sorted(self.cache_dir.glob('*.jpg'), key=lambda path: path.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.name] = size
+            self._total_bytes += size
+
+    def _filename(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest() + '.jpg'
+
+    def cached(self, url):
+        """Thumbnail bytes if cached, else None"""
+        name = self._filename(url)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        try:
+            return (self.cache_dir / name).read_bytes()
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(name, 0)
+            return None
+
+    def failed(self, url):
+        """Whether ``url`` failed recently and is not being retried yet"""
+        with self._lock:
+            expires = self._failures.get(url)
+            if expires is not None and expires <= time.time():
+                del self._failures[url]
+                return False
+            return expires is not None
+
+    def prefetch(self, urls):
+        """Start fetching thumbnails that are not cached yet; returns their futures by URL"""
+        futures = {}
+        for url in urls:
+            if url in futures or self.failed(url) or self._filename(url) in self._entries:
+                continue
+            with self._lock:
+                future = self._inflight.get(url)
+                if future is None:
+                    future = self._executor.submit(self._fetch, url)
+                    self._inflight[url] = future
+            futures[url] = future
+        return futures
+
+    def get_many(self, urls, wait_seconds=IMAGE_RENDER_WAIT_SECONDS):
+        """Thumbnail bytes for each URL, or None where it failed or is still loading after ``wait_seconds``"""
+        futures = self.prefetch(urls)
+        if futures:
+            wait(futures.values(), timeout=wait_seconds)
+        return {url: self.cached(url) for url in urls}
+
+    def _fetch(self, url):
+        try:
+            response = requests.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            with Image.open(BytesIO(response.content)) as image:
+                image.thumbnail(self.thumbnail_size)
+                if image.mode != 'RGB':
+                    background = Image.new('RGB', image.size, 'white')
+                    rgba = image.convert('RGBA')
+                    background.paste(rgba, mask=rgba.getchannel('A'))
+                    image = background
+                output = BytesIO()
+                image.save(output, format='JPEG', quality=85)
+            self._store(url, output.getvalue())
+        except Exception:
+            with self._lock:
+                self._failures[url] = time.time() + self.failure_ttl
+        finally:
+            with self._lock:
+                self._inflight.pop(url, None)
+
+    def _store(self, url, data):
+        name = self._filename(url)
+        _write_atomic(self.cache_dir / name, data)
+        with self._lock:
+            self._total_bytes += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                (self.cache_dir / evicted).unlink(missing_ok=True)
@@ -1,11 +1,22 @@
 # app.py
 import streamlit as st
 import pandas as pd
+import altair as alt
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode, DataReturnMode
-import requests
-from io import BytesIO
-import xlsxwriter
-import re
+import json
+import os
+import time
+import functools
+from pathlib import Path
+from inventory_core import (
+    EXPORT_FORMATS, IMPORT_DIR, ROW_ID_COLUMN, WORKBOOK_TTL_SECONDS,
+    InventoryImport, InventoryJournal, InventoryStore, SharedInventory,
+    convert_df_to_excel, diff_grid_edits, empty_inventory_frame, estimate_size,
+    frame_memory, get_perf_recorder, image_url_mask, layer_position, load_inventory_frame,
+    load_shelf_layout, location_layer_position, logical_frame, parse_scanned_codes, perf_logger,
+    read_import_chunks, reconcile_scans, timed, validate_inventory_rows,
+)
+from inventory_thumbnails import ThumbnailService
 
 # Configure page
 st.set_page_config(
@@ -14,187 +25,365 @@ st.set_page_config(
     layout="wide"
 )
 
-# GitHub URLs
-SAMPLE_ROOM_IMAGE = "https://raw.githubusercontent.com/Montsmed/Sample_Room/main/Sampleroom.png"
-PLACEHOLDER_IMAGE = "https://raw.githubusercontent.com/Montsmed/Sample_Room/main/No_Image.jpg"
-EXCEL_FILE_URL = "https://raw.githubusercontent.com/Montsmed/Sample_Room/main/inventory_data.xlsx"  # Replace with your actual Excel file URL
+# Gallery images: bundled placeholder (thumbnail settings are in inventory_thumbnails)
+LOCAL_PLACEHOLDER_IMAGE = Path(__file__).with_name('No_Image.jpg')
+
+# Gallery paging: page size choices and sort orders (label -> (column, ascending), None keeps shelf order)
+GALLERY_PAGE_SIZES = [9, 18, 36, 72]
+GALLERY_SORT_ORDERS = {
+    'Shelf order': None,
+    'Description (A–Z)': ('Description', True),
+    'Description (Z–A)': ('Description', False),
+    'Units (most first)': ('Unit', False),
+    'Units (fewest first)': ('Unit', True),
+}
+
+# Search results shown at most (top-k by relevance)
+SEARCH_RESULT_LIMITS = [50, 100, 500, 1000]
+
+# Performance debug panel shown (also toggled with ?debug=1); see inventory_core for the recorder
+PERF_PANEL = os.environ.get('INVENTORY_PERF_PANEL', '').lower() in ('1', 'true', 'yes')
 
-# Load data from GitHub Excel file
-@st.cache_data
-def load_inventory_data():
-    """Load inventory data from GitHub Excel file"""
+def session_state_footprint():
+    """Mapping of session-state key -> approximate bytes, largest first"""
+    sizes = {str(key): estimate_size(value) for key, value in st.session_state.items()}
+    return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+@st.cache_data(ttl=WORKBOOK_TTL_SECONDS)
+@timed('load_inventory_data')
+def load_inventory_data(revalidate=False):
+    """Load inventory data from GitHub Excel file, through the on-disk workbook cache"""
     try:
-        # Download Excel file from GitHub
-        response = requests.get(EXCEL_FILE_URL)
-        response.raise_for_status()
-        
-        # Read Excel file from bytes
-        excel_data = BytesIO(response.content)
-        df = pd.read_excel(excel_data)
+        df, source, error, issues = load_inventory_frame(revalidate=revalidate)
+        if source == 'stale-cache':
+            st.warning(f"⚠️ Could not reach GitHub ({error}); showing the last cached inventory")
+        elif source == 'bundled':
+            st.warning(f"⚠️ Could not load data from GitHub ({error}); showing the bundled inventory file")
         
-        # Clean and standardize data types
-        return clean_dataframe_types(df)
+        # Report rows rejected by schema validation
+        if not issues.empty:
+            st.warning(f"⚠️ {issues['Row'].nunique()} row(s) in the Excel file were rejected")
+            st.dataframe(issues, use_container_width=True)
+        return df
         
     except Exception as e:
         st.error(f"Error loading data from GitHub: {e}")
         # Return empty dataframe with correct structure if loading fails
-        return pd.DataFrame({
-            'Location': pd.Series([], dtype='string'),
-            'Description': pd.Series([], dtype='string'),
-            'Unit': pd.Series([], dtype='int64'),
-            'Model': pd.Series([], dtype='string'),
-            'SN/Lot': pd.Series([], dtype='string'),
-            'Remark': pd.Series([], dtype='string'),
-            'Image_URL': pd.Series([], dtype='string')
-        })
-
-def clean_dataframe_types(df):
-    """Clean and standardize DataFrame column types for Arrow compatibility"""
-    df_clean = df.copy()
-    
-    # Convert all columns to appropriate types
-    df_clean['Location'] = df_clean['Location'].astype('string')
-    df_clean['Description'] = df_clean['Description'].astype('string')
-    df_clean['Unit'] = pd.to_numeric(df_clean['Unit'], errors='coerce').fillna(0).astype('int64')
-    df_clean['Model'] = df_clean['Model'].astype('string')
-    df_clean['SN/Lot'] = df_clean['SN/Lot'].astype('string')
-    df_clean['Remark'] = df_clean['Remark'].astype('string')
-    df_clean['Image_URL'] = df_clean['Image_URL'].astype('string')
-    
-    # Replace NaN values with empty strings for string columns
-    string_columns = ['Location', 'Description', 'Model', 'SN/Lot', 'Remark', 'Image_URL']
-    for col in string_columns:
-        df_clean[col] = df_clean[col].fillna('')
-    
-    return df_clean
-
-def convert_df_to_excel(df):
-    """Convert dataframe to Excel format for download"""
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Inventory')
-        
-        # Get the xlsxwriter workbook and worksheet objects
-        workbook = writer.book
-        worksheet = writer.sheets['Inventory']
-        
-        # Add some formatting
-        header_format = workbook.add_format({
-            'bold': True,
-            'text_wrap': True,
-            'valign': 'top',
-            'fg_color': '#D7E4BC',
-            'border': 1
-        })
-        
-        # Write the column headers with the defined format
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-        
-        # Auto-adjust column widths
-        for i, col in enumerate(df.columns):
-            if len(df) > 0:  # Only if dataframe has data
-                max_length = max(
-                    df[col].astype(str).map(len).max(),
-                    len(str(col))
-                ) + 2
-            else:
-                max_length = len(str(col)) + 2
-            worksheet.set_column(i, i, min(max_length, 50))
-    
-    processed_data = output.getvalue()
-    return processed_data
+        return empty_inventory_frame(with_row_id=True)
+
+@st.cache_resource
+def get_shared_inventory():
+    """Shared inventory for this server process, loaded once from the saved journal or GitHub"""
+    journal = InventoryJournal()
+    store = journal.load()
+    if store is None:
+        store = InventoryStore(load_inventory_data())
+    return SharedInventory(store, journal)
+
+def sync_inventory_snapshot():
+    """Point the session at the shared snapshot, pulling newer versions if it has no unsaved edits"""
+    store, version = get_shared_inventory().snapshot()
+    if 'inventory' not in st.session_state or st.session_state.inventory.read_only:
+        st.session_state.inventory = store
+        st.session_state.snapshot_version = version
+
+def editable_inventory():
+    """The session's writable inventory, forking the shared snapshot on first write"""
+    if st.session_state.inventory.read_only:
+        st.session_state.inventory = st.session_state.inventory.fork()
+    return st.session_state.inventory
+
+def publish_inventory():
+    """Save the session's edits as the new shared snapshot and return any conflicts"""
+    shared = get_shared_inventory()
+    version, conflicts = shared.publish(st.session_state.inventory)
+    st.session_state.inventory, st.session_state.snapshot_version = shared.snapshot()
+    return conflicts
+
+def refresh_inventory(discard_saved=False):
+    """Replace the shared inventory with a fresh load of the GitHub workbook; returns the rejected rows
+
+    Raises RuntimeError, leaving the shared inventory as it is, unless the
+    workbook actually came from GitHub and could be read: the cached and
+    bundled fallbacks of load_inventory_data are only for the first load.
+    """
+    try:
+        df, source, error, issues = load_inventory_frame(revalidate=True)
+    except Exception as e:
+        raise RuntimeError(f"the GitHub workbook could not be read ({e})") from e
+    if source not in ('remote', 'not-modified'):
+        raise RuntimeError(f"GitHub could not be reached ({error})")
+    load_inventory_data.clear()
+    shared = get_shared_inventory()
+    shared.publish(InventoryStore(df), replace=True, discard_saved=discard_saved)
+    st.session_state.inventory, st.session_state.snapshot_version = shared.snapshot()
+    return issues
+
+def run_refresh(discard_saved=False):
+    """Refresh from GitHub, keeping the outcome to show after the rerun"""
+    try:
+        issues = refresh_inventory(discard_saved)
+    except RuntimeError as e:
+        st.session_state.refresh_result = ('error', f"❌ Data was not refreshed: {e}")
+        return
+    message = "Data refreshed successfully!"
+    if not issues.empty:
+        message += f" {issues['Row'].nunique()} row(s) in the Excel file were rejected."
+    st.session_state.refresh_result = ('success', message)
+
+@st.cache_resource
+def get_thumbnail_service():
+    """Thumbnail service shared by every session"""
+    return ThumbnailService()
+
+def shelf_grid_chart(room, location_counts, selected_location):
+    """Clickable shelf x layer grid for one room, with item counts"""
+    cells = pd.DataFrame(room['locations'], columns=['Shelf', 'Layer', 'Location'])
+    cells['Items'] = cells['Location'].map(location_counts).fillna(0).astype('int64')
+    cells['Label'] = cells['Location'] + '\n(' + cells['Items'].astype(str) + ' items)'
+    cells['Selected'] = cells['Location'] == selected_location
+    
+    selection = alt.selection_point(name='location', fields=['Location'])
+    base = alt.Chart(cells).encode(
+        x=alt.X('Shelf:N', sort=[shelf['name'] for shelf in room['shelves']],
+                axis=alt.Axis(orient='top', title=None, labelAngle=0)),
+        y=alt.Y('Layer:O', sort='descending', axis=alt.Axis(title='Layer'))
+    )
+    rects = base.mark_rect(cornerRadius=6, stroke='#FF4B4B').encode(
+        color=alt.Color('Items:Q', scale=alt.Scale(scheme='blues', domainMin=0), legend=None),
+        strokeWidth=alt.condition(alt.datum.Selected, alt.value(4), alt.value(0)),
+        tooltip=['Location', 'Items']
+    ).add_params(selection)
+    labels = base.mark_text(lineBreak='\n', fontSize=13).encode(
+        text='Label:N',
+        color=alt.condition(alt.datum.Items > cells['Items'].max() / 2, alt.value('white'), alt.value('black'))
+    )
+    layers = cells['Layer'].nunique()
+    return (rects + labels).properties(height=80 * layers)
+
+def _select_location(key):
+    """on_select callback of a shelf grid: remember the clicked location"""
+    points = st.session_state[key].selection.get('location', [])
+    if points:
+        st.session_state.selected_location = points[0]['Location']
+
+def new_item_row(location):
+    """Single placeholder row for a newly added item"""
+    return pd.DataFrame({
+        'Location': [location],
+        'Description': ['New Item'],
+        'Unit': [1],
+        'Model': [''],
+        'SN/Lot': [''],
+        'Remark': [''],
+        'Image_URL': ['']
+    })
+
+def data_version():
+    """Version of the data page sections show
+
+    It changes with any add/edit/delete, and also when the session forks or
+    pulls a snapshot.
+    """
+    inventory = st.session_state.inventory
+    return id(inventory), inventory.version
 
-# Initialize session state
-if 'inventory_data' not in st.session_state:
-    st.session_state.inventory_data = load_inventory_data()
-if 'selected_location' not in st.session_state:
-    st.session_state.selected_location = None
+def rerun_if_data_changed(version_before):
+    """From a fragment: rerun the whole app if the fragment changed the data other sections show"""
+    if data_version() != version_before:
+        st.rerun()
 
+@timed('create_header')
 def create_header():
     """Create header"""
     st.markdown("## 📦 Inventory Management System")
 
+@st.fragment
+@timed('create_search_bar')
 def create_search_bar():
     """Create search functionality for inventory items"""
     st.markdown("## 🔍 Search Inventory Items")
     
-    if len(st.session_state.inventory_data) == 0:
+    if len(st.session_state.inventory) == 0:
         st.info("No inventory data available. Please check the GitHub file URL.")
         return
     
-    search_query = st.text_input(
-        "Enter search term (description, SN/Lot, model):",
-        placeholder="Type to search items..."
-    )
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        search_query = st.text_input(
+            "Enter search term (description, SN/Lot, model):",
+            placeholder="Type to search items..."
+        )
+    with col2:
+        max_results = st.selectbox("Max results", SEARCH_RESULT_LIMITS, index=1)
     
     if search_query:
-        # Case-insensitive partial match in Description, SN/Lot, or Model
-        pattern = re.compile(re.escape(search_query), re.IGNORECASE)
-        filtered_data = st.session_state.inventory_data[
-            st.session_state.inventory_data['Description'].str.contains(pattern, na=False) |
-            st.session_state.inventory_data['SN/Lot'].str.contains(pattern, na=False) |
-            st.session_state.inventory_data['Model'].str.contains(pattern, na=False)
-        ]
+        # Case-insensitive partial match in Description, SN/Lot, or Model, best matches first
+        filtered_data, total_matches = st.session_state.inventory.search(search_query, limit=max_results)
         
-        if len(filtered_data) > 0:
-            st.markdown(f"### 🎯 Search Results: {len(filtered_data)} item(s) found")
-            st.dataframe(filtered_data, use_container_width=True)
+        if total_matches > 0:
+            st.markdown(f"### 🎯 Search Results: {total_matches} item(s) found")
+            if total_matches > len(filtered_data):
+                st.caption(f"Showing the top {len(filtered_data)} matches")
+            st.dataframe(filtered_data.drop(columns=ROW_ID_COLUMN), use_container_width=True)
         else:
             st.warning(f"No items found matching '{search_query}'")
     else:
         st.info("Type in the search box to find items by description, SN/Lot, or model.")
 
+def read_scanned_codes(upload):
+    """Scanned codes from an uploaded .txt (as pasted text) or .csv/.xlsx (SN/Lot column, else the first)"""
+    if Path(upload.name).suffix.lower() == '.txt':
+        return parse_scanned_codes(upload.getvalue().decode('utf-8', errors='replace'))
+    codes = []
+    for chunk in read_import_chunks(upload):
+        column = 'SN/Lot' if 'SN/Lot' in chunk.columns else chunk.columns[0]
+        codes.extend(str(code).strip() for code in chunk[column] if code is not None and str(code).strip())
+    return codes
+
+@st.fragment
+@timed('create_batch_lookup')
+def create_batch_lookup():
+    """Bulk SN/Lot lookup for stock-taking, with an exportable reconciliation sheet"""
+    inventory = st.session_state.inventory
+    if len(inventory) == 0:
+        return
+    
+    with st.expander("📋 Batch SN/Lot Lookup", expanded='batch_lookup' in st.session_state):
+        col1, col2 = st.columns(2)
+        with col1:
+            pasted = st.text_area("Scanned SN/Lot codes (one per line)", height=150, key='lookup_codes')
+        with col2:
+            upload = st.file_uploader("Or upload a list", type=['txt', 'csv', 'xlsx'], key='lookup_upload')
+            counted = st.multiselect(
+                "Locations being counted",
+                sorted(inventory.counts()),
+                help="Items stored at these locations that were not scanned are listed as 'Not scanned'"
+            )
+        
+        if st.button("🔎 Look Up", disabled=not pasted.strip() and upload is None):
+            try:
+                codes = parse_scanned_codes(pasted) + (read_scanned_codes(upload) if upload is not None else [])
+                st.session_state.batch_lookup = reconcile_scans(inventory, codes, counted)
+                # Downloads of this sheet, built once per file format
+                st.session_state.batch_lookup_exports = {}
+            except Exception as e:
+                st.error(f"Could not read the scanned codes: {e}")
+        
+        sheet = st.session_state.get('batch_lookup')
+        if sheet is None:
+            return
+        
+        # Counts are per scanned code, except 'Not scanned' (per stored item)
+        codes = sheet[sheet['Status'] != 'Not scanned'].drop_duplicates('Scanned')
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Found", int((codes['Status'] == 'Found').sum()))
+        col2.metric("Missing", int((codes['Status'] == 'Missing').sum()))
+        col3.metric("Duplicate Locations", int((codes['Status'] == 'Duplicate locations').sum()))
+        col4.metric("Not Scanned", int((sheet['Status'] == 'Not scanned').sum()))
+        
+        statuses = st.multiselect("Show", list(sheet['Status'].unique()), default=list(sheet['Status'].unique()))
+        st.dataframe(sheet[sheet['Status'].isin(statuses)], hide_index=True, use_container_width=True)
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            export_format = st.selectbox("File format", list(EXPORT_FORMATS), key='lookup_format')
+        converter, extension, mime = EXPORT_FORMATS[export_format]
+        exports = st.session_state.batch_lookup_exports
+        if export_format not in exports:
+            exports[export_format] = converter(sheet)
+        with col2:
+            st.download_button(
+                label="📥 Download Reconciliation Sheet",
+                data=exports[export_format],
+                file_name=f"reconciliation_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                mime=mime
+            )
+
+@st.fragment
+@timed('create_file_management')
 def create_file_management():
     """Create download section only"""
     st.markdown("## 📁 File Management")
     
     # Show data status
-    if len(st.session_state.inventory_data) > 0:
-        st.success(f"✅ Inventory data loaded successfully! ({len(st.session_state.inventory_data)} items)")
+    if len(st.session_state.inventory) > 0:
+        st.success(f"✅ Inventory data loaded successfully! ({len(st.session_state.inventory)} items)")
     else:
         st.warning("⚠️ No inventory data available. Please check the GitHub file URL.")
     
+    # Shared snapshot status
+    shared_version = get_shared_inventory().version
+    if not st.session_state.inventory.read_only:
+        st.caption("✏️ You have unsaved edits. Click 💾 Save Changes to share them with other users.")
+        if shared_version != st.session_state.snapshot_version:
+            st.info("A newer inventory version has been saved by another user. Saving will apply your edits on top of it.")
+            if st.button("⬇️ Load Latest Version", help="Discard your unsaved edits and load the latest shared inventory"):
+                del st.session_state.inventory
+                sync_inventory_snapshot()
+                st.rerun()
+    
     # Download section
-    st.markdown("### 📥 Download Excel File")
+    st.markdown("### 📥 Download Inventory File")
     
-    if len(st.session_state.inventory_data) > 0:
+    if len(st.session_state.inventory) > 0:
         col1, col2 = st.columns(2)
         
         with col1:
-            st.write("Download the current inventory data as an Excel file")
+            st.write("Download the current inventory data as an Excel, CSV or Parquet file")
+            export_format = st.selectbox("File format", list(EXPORT_FORMATS))
+            _, extension, mime = EXPORT_FORMATS[export_format]
             
-            # Convert dataframe to Excel
-            excel_data = convert_df_to_excel(st.session_state.inventory_data)
+            # Export bytes are cached per data version
+            export_data = st.session_state.inventory.export(export_format)
             
             # Create download button
             st.download_button(
                 label="📥 Download Inventory Data",
-                data=excel_data,
-                file_name=f"inventory_data_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                help="Download the current inventory data as an Excel file"
+                data=export_data,
+                file_name=f"inventory_data_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                mime=mime,
+                help="Download the current inventory data"
             )
         
         with col2:
             # Refresh data button
             if st.button("🔄 Refresh Data from GitHub", help="Reload data from the GitHub repository"):
-                st.session_state.inventory_data = load_inventory_data()
-                st.success("Data refreshed successfully!")
+                # Saved edits are not written back to GitHub, so reloading would discard them
+                if get_shared_inventory().saved_changes:
+                    st.session_state.confirm_refresh = True
+                else:
+                    run_refresh()
                 st.rerun()
+            
+            refresh_result = st.session_state.pop('refresh_result', None)
+            if refresh_result is not None:
+                kind, message = refresh_result
+                if kind == 'error':
+                    st.error(message)
+                else:
+                    st.success(message)
+            
+            if st.session_state.get('confirm_refresh'):
+                saved = get_shared_inventory().saved_changes
+                st.warning(
+                    f"⚠️ {saved} change(s) have been saved since the data was last loaded from GitHub. They are "
+                    "not in the GitHub file, so refreshing discards them for every user. Download the inventory "
+                    "first to keep a copy."
+                )
+                confirm_col, cancel_col = st.columns(2)
+                if confirm_col.button("Discard Saved Changes and Refresh", type="primary"):
+                    del st.session_state.confirm_refresh
+                    run_refresh(discard_saved=True)
+                    st.rerun()
+                if cancel_col.button("Cancel"):
+                    del st.session_state.confirm_refresh
+                    st.rerun()
     else:
         st.info("No data available to download.")
         
         # Provide template download
-        template_data = pd.DataFrame({
-            'Location': pd.Series([], dtype='string'),
-            'Description': pd.Series([], dtype='string'),
-            'Unit': pd.Series([], dtype='int64'),
-            'Model': pd.Series([], dtype='string'),
-            'SN/Lot': pd.Series([], dtype='string'),
-            'Remark': pd.Series([], dtype='string'),
-            'Image_URL': pd.Series([], dtype='string')
-        })
+        template_data = empty_inventory_frame()
         template_excel = convert_df_to_excel(template_data)
         
         st.download_button(
@@ -205,63 +394,129 @@ def create_file_management():
             help="Download an empty template to fill with your inventory data"
         )
 
+def import_sources(uploads, paths):
+    """(name, source) for uploaded files and for server paths inside IMPORT_DIR"""
+    sources = [(upload.name, upload) for upload in uploads]
+    if paths and not IMPORT_DIR:
+        raise ValueError("Importing from server paths is disabled (set INVENTORY_IMPORT_DIR)")
+    for path in paths:
+        resolved = (Path(IMPORT_DIR) / path).resolve()
+        if not resolved.is_relative_to(Path(IMPORT_DIR).resolve()):
+            raise ValueError(f"{path}: outside the import directory")
+        if not resolved.is_file():
+            raise ValueError(f"{path}: no such file")
+        sources.append((path, resolved))
+    return sources
+
+@st.fragment
+@timed('create_bulk_import')
+def create_bulk_import():
+    """Bulk import of xlsx/CSV files, upserted into the session's inventory"""
+    with st.expander("📤 Bulk Import", expanded='import_summary' in st.session_state):
+        st.write(
+            "Import one or more Excel (.xlsx) or CSV files with the inventory columns. Rows that match an "
+            "existing item by SN/Lot and Location update it; all other rows are added."
+        )
+        uploads = st.file_uploader("Files", type=['xlsx', 'csv'], accept_multiple_files=True, key='import_uploads')
+        paths = []
+        if IMPORT_DIR:
+            paths = st.text_area(f"Or paths under {IMPORT_DIR} (one per line)", key='import_paths').split('\n')
+            paths = [path.strip() for path in paths if path.strip()]
+        
+        if st.button("📤 Import", disabled=not uploads and not paths):
+            # Forks the shared snapshot only once the import actually changes something
+            bulk_import = InventoryImport(st.session_state.inventory, editable=editable_inventory)
+            progress = st.progress(0.0)
+            status = st.empty()
+            error = None
+            try:
+                sources = import_sources(uploads or [], paths)
+                for number, (name, source) in enumerate(sources):
+                    read = 0
+                    for chunk in read_import_chunks(source):
+                        bulk_import.feed(chunk, name)
+                        read += len(chunk)
+                        status.caption(f"{name}: {read:,} rows read")
+                    progress.progress((number + 1) / len(sources))
+            except Exception as e:
+                error = str(e)
+            # Rows imported before an error are kept, like any other unsaved edit
+            st.session_state.import_summary = {
+                'counts': bulk_import.summary(),
+                'issues': bulk_import.issues_frame(),
+                'error': error,
+                'conflicts': None
+            }
+            st.rerun()
+        
+        result = st.session_state.get('import_summary')
+        if result is not None:
+            if result['error']:
+                st.error(f"Import stopped: {result['error']}")
+            st.dataframe(pd.DataFrame([result['counts']]), hide_index=True, use_container_width=True)
+            issues, rejected = result['issues'], result['counts']['Rejected']
+            if not issues.empty:
+                shown = f"the first {len(issues)} " if rejected > len(issues) else ""
+                st.warning(f"⚠️ {rejected} row(s) were rejected; {shown}problems:")
+                st.dataframe(issues, hide_index=True, use_container_width=True)
+            
+            conflicts = result['conflicts']
+            if conflicts is not None:
+                st.success("Imported changes saved.")
+                if not conflicts.empty:
+                    st.warning(f"⚠️ {len(conflicts)} change(s) were not applied because another user changed the same items first:")
+                    st.dataframe(conflicts, use_container_width=True)
+            elif not st.session_state.inventory.read_only:
+                st.caption("Imported rows are unsaved edits until you save them.")
+                if st.button("💾 Save Imported Changes"):
+                    result['conflicts'] = publish_inventory()
+                    st.rerun()
+
+@timed('create_shelf_visualization')
 def create_shelf_visualization():
-    """Create interactive shelf visualization with resized sample room layout image"""
-    # Room layout image from GitHub - resized to 1/3 width and height
-    st.markdown("### 🏠 Sample Room Layout")
-    try:
-        st.image(SAMPLE_ROOM_IMAGE, caption="Sample Room Layout", width=400)
-    except:
-        st.error("Could not load sample room image from GitHub")
+    """Create interactive shelf visualization with resized room layout images"""
+    layout = load_shelf_layout()
+    
+    # Room layout images - resized to 1/3 width and height
+    for room in layout['rooms']:
+        if room['image']:
+            st.markdown(f"### 🏠 {room['name']} Layout")
+            try:
+                st.image(room['image'], caption=f"{room['name']} Layout", width=400)
+            except:
+                st.error(f"Could not load the {room['name']} image")
     
     st.markdown("### 🗄️ Shelf Layout")
-    st.markdown("**Layer arrangement: 4 (Top) → 3 → 2 → 1 (Bottom)**")
+    layers = sorted(layout['layer_positions'], reverse=True)
+    if layers:
+        arrangement = ' → '.join(str(layer) for layer in layers)
+        st.markdown(f"**Layer arrangement: {arrangement} ({layout['layer_positions'][layers[0]]} → {layout['layer_positions'][layers[-1]]})**")
     
-    if len(st.session_state.inventory_data) == 0:
+    if len(st.session_state.inventory) == 0:
         st.info("📊 No inventory data available. Please check the GitHub file URL.")
         return
     
     st.markdown("Click on any shelf location to view and edit inventory items:")
     
-    # Define shelf letters
-    SHELF_LETTERS = ['A', 'B', 'C', 'D', 'E']
-    
-    # Create 4 rows for layers 4, 3, 2, 1 (top to bottom)
-    for layer in [4, 3, 2, 1]:
-        cols = st.columns(5)
-        
-        for i, shelf in enumerate(SHELF_LETTERS):
-            with cols[i]:
-                # Define valid layers for each shelf
-                if shelf in ['A', 'B']:
-                    valid_layers = [1, 2, 3]
-                elif shelf in ['C', 'D']:
-                    valid_layers = [1, 2, 3, 4]
-                elif shelf == 'E':
-                    valid_layers = [4]
-                else:
-                    valid_layers = []
-                
-                if layer in valid_layers:
-                    location = f"{shelf}{layer}"
-                    item_count = len(st.session_state.inventory_data[
-                        st.session_state.inventory_data['Location'] == location
-                    ])
-                    
-                    # Simple button text without visual indicators
-                    button_text = f"{location}\n({item_count} items)"
-                    
-                    # Use secondary button type (blue)
-                    if st.button(button_text, key=f"btn_{location}", type="secondary"):
-                        st.session_state.selected_location = location
-                        st.rerun()
-                else:
-                    # Empty space for shelves that don't have this layer
-                    st.write("")
+    # One aggregation for every location, one grid component per room
+    location_counts = st.session_state.inventory.counts()
+    for room in layout['rooms']:
+        if len(layout['rooms']) > 1:
+            st.markdown(f"#### {room['name']}")
+        key = f"shelf_grid_{room['name']}"
+        st.altair_chart(
+            shelf_grid_chart(room, location_counts, st.session_state.selected_location),
+            key=key,
+            on_select=functools.partial(_select_location, key),
+            selection_mode='location',
+            use_container_width=True
+        )
 
+@timed('create_inventory_editor')
 def create_inventory_editor():
     """Create inventory editor for selected location with improved delete functionality"""
-    if len(st.session_state.inventory_data) == 0:
+    inventory = st.session_state.inventory
+    if len(inventory) == 0:
         st.info("📊 No inventory data available. Please check the GitHub file URL.")
         return
         
@@ -270,39 +525,33 @@ def create_inventory_editor():
         return
     
     location = st.session_state.selected_location
-    layer_num = location[-1]
-    layer_position = "Top" if layer_num == "4" else "Upper" if layer_num == "3" else "Lower" if layer_num == "2" else "Bottom"
+    position = location_layer_position(location)
     
-    st.markdown(f"## 📝 Inventory Editor - Location {location} ({layer_position} Layer)")
+    st.markdown(f"## 📝 Inventory Editor - Location {location} ({position} Layer)")
+    
+    # Result of the last save, kept across the rerun that refreshes the grid
+    conflicts = st.session_state.pop('save_conflicts', None)
+    if conflicts is not None:
+        if conflicts.empty:
+            st.success("Changes saved successfully!")
+        else:
+            st.success("Changes saved. Edits that did not conflict were merged with other users' changes.")
+            st.warning(f"⚠️ {len(conflicts)} edit(s) were not applied because another user changed the same items first:")
+            st.dataframe(conflicts, use_container_width=True)
     
     # Filter data for selected location
-    location_data = st.session_state.inventory_data[
-        st.session_state.inventory_data['Location'] == location
-    ].copy()
+    location_data = inventory.location_data(location)
     
     if location_data.empty:
         st.warning(f"No items found in location {location}")
         
         # Allow adding new items
         if st.button("➕ Add New Item"):
-            new_row = pd.DataFrame({
-                'Location': [location],
-                'Description': ['New Item'],
-                'Unit': [1],
-                'Model': [''],
-                'SN/Lot': [''],
-                'Remark': [''],
-                'Image_URL': ['']
-            })
-            new_row = clean_dataframe_types(new_row)
-            combined_data = pd.concat([st.session_state.inventory_data, new_row], ignore_index=True)
-            st.session_state.inventory_data = clean_dataframe_types(combined_data)
+            editable_inventory().add_rows(new_item_row(location))
             st.rerun()
         return
     
-    # Clean data types before displaying
-    location_data = clean_dataframe_types(location_data)
-    location_data = location_data.reset_index(drop=True)
+    location_data = logical_frame(location_data).reset_index(drop=True)
     
     # Configure grid options - Location column is now editable
     gb = GridOptionsBuilder.from_dataframe(location_data)
@@ -313,6 +562,7 @@ def create_inventory_editor():
         filter=True
     )
     gb.configure_column('Image_URL', width=200)
+    gb.configure_column(ROW_ID_COLUMN, hide=True, editable=False)
     
     # Configure selection - use only built-in row selection
     gb.configure_selection(
@@ -335,37 +585,30 @@ def create_inventory_editor():
         update_mode=GridUpdateMode.MODEL_CHANGED,
         fit_columns_on_grid_load=True,
         allow_unsafe_jscode=True,
-        key=f"grid_{location}",
+        key=f"grid_{location}_{inventory.snapshot_version}",
         enable_enterprise_modules=False
     )
     
-    # Update session state with edited data
+    # Update session state with edited cells only, matched to stored rows by row ID
     if grid_response['data'] is not None:
         edited_data = grid_response['data']
-        edited_data = clean_dataframe_types(edited_data)
-        # Update the main dataframe
-        mask = st.session_state.inventory_data['Location'] == location
-        remaining_data = st.session_state.inventory_data[~mask]
-        combined_data = pd.concat([remaining_data, edited_data], ignore_index=True)
-        st.session_state.inventory_data = clean_dataframe_types(combined_data)
+        edited_data = edited_data.set_axis(edited_data[ROW_ID_COLUMN].astype('int64').to_numpy())
+        edited_data = edited_data[edited_data.index.isin(inventory.df.index)]
+        edited_data, issues = validate_inventory_rows(edited_data)
+        if not issues.empty:
+            st.warning("⚠️ Some edits were not applied because they don't match the inventory format:")
+            st.dataframe(issues.rename(columns={'Row': 'Row ID'}), use_container_width=True)
+        changes = diff_grid_edits(inventory.df, edited_data)
+        if changes:
+            inventory = editable_inventory()
+            inventory.update_cells(changes)
     
     # Action buttons - Reduced to 3 columns
     col1, col2, col3 = st.columns(3)
     
     with col1:
         if st.button("➕ Add New Item", key=f"add_{location}"):
-            new_row = pd.DataFrame({
-                'Location': [location],
-                'Description': ['New Item'],
-                'Unit': [1],
-                'Model': [''],
-                'SN/Lot': [''],
-                'Remark': [''],
-                'Image_URL': ['']
-            })
-            new_row = clean_dataframe_types(new_row)
-            combined_data = pd.concat([st.session_state.inventory_data, new_row], ignore_index=True)
-            st.session_state.inventory_data = clean_dataframe_types(combined_data)
+            editable_inventory().add_rows(new_item_row(location))
             st.rerun()
     
     with col2:
@@ -374,40 +617,10 @@ def create_inventory_editor():
             if grid_response['selected_rows'] is not None and len(grid_response['selected_rows']) > 0:
                 selected_rows_df = pd.DataFrame(grid_response['selected_rows'])
                 
-                # Get current location data
-                current_location_data = st.session_state.inventory_data[
-                    st.session_state.inventory_data['Location'] == location
-                ].copy()
-                
-                # Create a list to track which rows to keep
-                rows_to_keep = []
-                
-                for idx, current_row in current_location_data.iterrows():
-                    # Check if this row is in the selected rows
-                    is_selected = False
-                    for _, selected_row in selected_rows_df.iterrows():
-                        # Compare key fields to identify the row
-                        if (str(current_row['Description']) == str(selected_row['Description']) and 
-                            str(current_row['Model']) == str(selected_row['Model']) and 
-                            str(current_row['SN/Lot']) == str(selected_row['SN/Lot']) and
-                            int(current_row['Unit']) == int(selected_row['Unit'])):
-                            is_selected = True
-                            break
-                    
-                    if not is_selected:
-                        rows_to_keep.append(current_row)
-                
-                # Update the main dataframe
-                mask = st.session_state.inventory_data['Location'] == location
-                other_data = st.session_state.inventory_data[~mask]
-                
-                if rows_to_keep:
-                    remaining_location_data = pd.DataFrame(rows_to_keep)
-                    st.session_state.inventory_data = pd.concat([other_data, remaining_location_data], ignore_index=True)
-                else:
-                    st.session_state.inventory_data = other_data
-                
-                st.session_state.inventory_data = clean_dataframe_types(st.session_state.inventory_data)
+                # Delete the selected rows by their row ID
+                selected_ids = selected_rows_df[ROW_ID_COLUMN].astype('int64')
+                inventory = editable_inventory()
+                inventory.delete_rows(inventory.df.index.intersection(selected_ids))
                 
                 st.success(f"Deleted {len(selected_rows_df)} item(s)")
                 st.rerun()
@@ -416,27 +629,64 @@ def create_inventory_editor():
     
     with col3:
         if st.button("💾 Save Changes", key=f"save_{location}"):
-            st.success("Changes saved successfully!")
+            if st.session_state.inventory.read_only:
+                st.info("No unsaved changes")
+            else:
+                st.session_state.save_conflicts = publish_inventory()
+                st.rerun()
+
+def item_image_urls(items):
+    """Image URLs of the items that have one, stripped, indexed by row ID"""
+    urls = items['Image_URL'].astype('string').str.strip()
+    return urls[image_url_mask(urls)]
 
+@st.fragment
+@timed('create_image_gallery')
 def create_image_gallery():
     """Create simplified image gallery showing only description and units"""
-    if len(st.session_state.inventory_data) == 0 or st.session_state.selected_location is None:
+    if len(st.session_state.inventory) == 0 or st.session_state.selected_location is None:
         return
     
     location = st.session_state.selected_location
-    location_data = st.session_state.inventory_data[
-        st.session_state.inventory_data['Location'] == location
-    ]
+    location_data = st.session_state.inventory.location_data(location)
     
     if location_data.empty:
         return
     
-    layer_num = location[-1]
-    layer_position = "Top" if layer_num == "4" else "Upper" if layer_num == "3" else "Lower" if layer_num == "2" else "Bottom"
+    position = location_layer_position(location)
+    
+    st.markdown(f"## 🖼️ Image Gallery - Location {location} ({position} Layer)")
     
-    st.markdown(f"## 🖼️ Image Gallery - Location {location} ({layer_position} Layer)")
+    # Paging and sort controls
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sort_order = st.selectbox("Sort by", list(GALLERY_SORT_ORDERS), key=f"gallery_sort_{location}")
+    with col2:
+        page_size = st.selectbox("Items per page", GALLERY_PAGE_SIZES, key=f"gallery_page_size_{location}")
+    page_count = (len(location_data) + page_size - 1) // page_size
+    with col3:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1,
+                               key=f"gallery_page_{location}_{page_size}_{sort_order}")
+    
+    if GALLERY_SORT_ORDERS[sort_order] is not None:
+        column, ascending = GALLERY_SORT_ORDERS[sort_order]
+        sort_key = (lambda values: values.str.lower()) if column == 'Description' else None
+        location_data = location_data.sort_values(column, ascending=ascending, kind='stable', key=sort_key)
+    
+    start = (page - 1) * page_size
+    page_data = location_data.iloc[start:start + page_size]
+    next_page_data = location_data.iloc[start + page_size:start + 2 * page_size]
+    st.caption(f"Showing items {start + 1}–{start + len(page_data)} of {len(location_data)}")
+    
+    # Fetch this page's thumbnails concurrently (served from the disk cache when available),
+    # then start on the next page in the background
+    thumbnail_service = get_thumbnail_service()
+    page_urls = item_image_urls(page_data)
+    thumbnails = thumbnail_service.get_many(page_urls.tolist())
+    thumbnail_service.prefetch(item_image_urls(next_page_data).tolist())
     
     # Create image gallery
+    location_data = page_data
     cols_per_row = 3
     rows = len(location_data) // cols_per_row + (1 if len(location_data) % cols_per_row > 0 else 0)
     
@@ -447,83 +697,151 @@ def create_image_gallery():
             if item_idx < len(location_data):
                 item = location_data.iloc[item_idx]
                 with cols[col_idx]:
-                    try:
-                        if item['Image_URL'] and str(item['Image_URL']).strip() and str(item['Image_URL']) != 'nan':
-                            st.image(
-                                item['Image_URL'],
-                                use_container_width=True
-                            )
-                        else:
-                            st.image(
-                                PLACEHOLDER_IMAGE,
-                                use_container_width=True
-                            )
-                    except:
-                        st.image(
-                            PLACEHOLDER_IMAGE,
-                            use_container_width=True
-                        )
+                    thumbnail = None
+                    if item.name in page_urls.index:
+                        thumbnail = thumbnails.get(page_urls[item.name])
+                    st.image(
+                        thumbnail if thumbnail is not None else str(LOCAL_PLACEHOLDER_IMAGE),
+                        use_container_width=True
+                    )
                     
                     # Show only description and unit count
                     st.markdown(f"**{item['Description']}**")
                     st.markdown(f"Units: {item['Unit']}")
 
+@st.fragment
+@timed('create_location_section')
+def create_location_section():
+    """Shelf grid, editor and gallery, rerun together when a shelf is clicked or the grid is edited"""
+    version_before = data_version()
+    create_shelf_visualization()
+    create_inventory_editor()
+    create_image_gallery()
+    rerun_if_data_changed(version_before)
+
+@timed('create_statistics_sidebar')
 def create_statistics_sidebar():
     """Create statistics sidebar with layer information"""
     with st.sidebar:
         st.markdown("## 📊 Inventory Statistics")
         
-        total_items = len(st.session_state.inventory_data)
+        # Materialized per-location aggregates: O(#locations) regardless of inventory size
+        inventory = st.session_state.inventory
+        location_stats = inventory.location_stats()
+        total_items = len(inventory)
         st.metric("Total Items", total_items)
         
         if total_items == 0:
             st.info("No inventory data available")
             return
         
+        st.metric("Total Units", sum(units for _, units, _ in location_stats.values()))
+        
         # Items by shelf and layer
         st.markdown("### Items by Shelf & Layer")
-        for shelf in ['A', 'B', 'C', 'D', 'E']:
-            shelf_items = len(st.session_state.inventory_data[
-                st.session_state.inventory_data['Location'].str.startswith(shelf)
-            ])
-            st.metric(f"Shelf {shelf}", shelf_items)
-            
-            # Show layer breakdown
-            if shelf in ['A', 'B']:
-                layers = [1, 2, 3]
-            elif shelf in ['C', 'D']:
-                layers = [1, 2, 3, 4]
-            else:  # E
-                layers = [4]
-            
-            layer_text = ""
-            for layer in sorted(layers, reverse=True):  # Top to bottom
-                layer_count = len(st.session_state.inventory_data[
-                    st.session_state.inventory_data['Location'] == f"{shelf}{layer}"
-                ])
-                position = "Top" if layer == 4 else "Upper" if layer == 3 else "Lower" if layer == 2 else "Bottom"
-                layer_text += f"  • L{layer} ({position}): {layer_count}\n"
-            
-            if layer_text:
-                st.text(layer_text.strip())
+        rooms = load_shelf_layout()['rooms']
+        for room in rooms:
+            if len(rooms) > 1:
+                st.markdown(f"#### {room['name']}")
+            for shelf in room['shelves']:
+                shelf_locations = [(layer, location) for name, layer, location in room['locations'] if name == shelf['name']]
+                shelf_stats = [location_stats.get(location, (0, 0, 0)) for _, location in shelf_locations]
+                st.metric(f"Shelf {shelf['name']}", sum(items for items, _, _ in shelf_stats))
+                st.caption(f"{sum(units for _, units, _ in shelf_stats)} units")
+                
+                # Show layer breakdown, top to bottom
+                layer_text = ""
+                for (layer, _), (layer_count, layer_units, _) in zip(shelf_locations, shelf_stats):
+                    layer_text += f"  • L{layer} ({layer_position(layer)}): {layer_count} ({layer_units} units)\n"
+                
+                if layer_text:
+                    st.text(layer_text.strip())
         
         # Items with images
-        items_with_images = len(st.session_state.inventory_data[
-            (st.session_state.inventory_data['Image_URL'].notna()) & 
-            (st.session_state.inventory_data['Image_URL'] != '') &
-            (st.session_state.inventory_data['Image_URL'] != 'nan')
-        ])
+        items_with_images = sum(images for _, _, images in location_stats.values())
         st.metric("Items with Images", items_with_images)
+        st.caption(f"{items_with_images / total_items:.0%} image coverage")
+
+def perf_panel_enabled():
+    return PERF_PANEL or st.query_params.get('debug') in ('1', 'true')
+
+def create_perf_panel():
+    """Debug sidebar panel with rolling section timings and the session-state footprint"""
+    recorder = get_perf_recorder()
+    with st.sidebar.expander("⏱️ Performance", expanded=False):
+        summary = recorder.summary()
+        if summary:
+            st.dataframe(
+                pd.DataFrame.from_dict(summary, orient='index').sort_values('p95_ms', ascending=False),
+                use_container_width=True
+            )
+        else:
+            st.caption("No samples yet")
+        
+        # The unedited inventory is the shared snapshot, not a per-session copy
+        footprint = session_state_footprint()
+        inventory = st.session_state.get('inventory')
+        shared = 'inventory' if inventory is not None and inventory.read_only else None
+        session_bytes = sum(size for key, size in footprint.items() if key != shared)
+        st.metric("Session State", f"{session_bytes / 1024 ** 2:.2f} MB")
+        if shared:
+            st.caption(f"Excluding the shared snapshot ({footprint[shared] / 1024 ** 2:.2f} MB)")
+        inventory_memory = frame_memory(inventory.df) if inventory is not None else None
+        if inventory_memory:
+            saved = 1 - inventory_memory['stored_bytes'] / max(inventory_memory['plain_bytes'], 1)
+            st.caption(
+                f"Inventory frame alone: {inventory_memory['stored_bytes'] / 1024 ** 2:.2f} MB stored, "
+                f"{inventory_memory['plain_bytes'] / 1024 ** 2:.2f} MB with plain dtypes ({saved:.0%} saved)"
+            )
+            parts = inventory.memory_breakdown()
+            st.caption(
+                f"Held beside the frame: search index {parts['search_index'] / 1024 ** 2:.2f} MB, "
+                f"SN/Lot index {parts['serial_index'] / 1024 ** 2:.2f} MB, "
+                f"location index {parts['location_index'] / 1024 ** 2:.2f} MB, "
+                f"row stamps {parts['row_stamps'] / 1024 ** 2:.2f} MB, "
+                f"exports {parts['exports'] / 1024 ** 2:.2f} MB"
+            )
+        st.dataframe(
+            pd.DataFrame({'Key': list(footprint), 'Bytes': list(footprint.values())}),
+            hide_index=True,
+            use_container_width=True
+        )
+        perf_logger.info(json.dumps({'ts': time.time(), 'section': 'session_state', 'bytes': session_bytes}))
+        
+        report = {'ts': time.time(), 'window': recorder.window, 'sections': summary,
+                  'session_state_bytes': footprint, 'inventory_frame': inventory_memory}
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button("📥 JSON", data=json.dumps(report, indent=2), file_name="perf_report.json",
+                               mime="application/json", use_container_width=True)
+        with col2:
+            log_lines = [json.dumps({'ts': report['ts'], 'section': section, **stats}) for section, stats in summary.items()]
+            st.download_button("📥 Log", data="\n".join(log_lines) + "\n", file_name="perf_report.jsonl",
+                               mime="application/x-ndjson", use_container_width=True)
+        with col3:
+            if st.button("Reset", use_container_width=True):
+                recorder.reset()
+                st.rerun()
 
 # Main app
+@timed('rerun')
 def main():
+    # Initialize session state
+    sync_inventory_snapshot()
+    if 'selected_location' not in st.session_state:
+        st.session_state.selected_location = None
+    
+    # Sections other than the header and sidebar are fragments: their own widgets rerun only
+    # that section, and a fragment that changes the data reruns the whole page
     create_header()
     create_statistics_sidebar()
     create_file_management()
+    create_bulk_import()
     create_search_bar()
-    create_shelf_visualization()
-    create_inventory_editor()
-    create_image_gallery()
+    create_batch_lookup()
+    create_location_section()
+    if perf_panel_enabled():
+        create_perf_panel()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import inventory_core as core
+
+def make_rows(count, location='A1', start=0, **values):
+    """Valid inventory rows item <start>..<start + count - 1>, one unit each with SN/Lot S<n>"""
+    rows = pd.DataFrame({
+        'Location': location,
+        'Description': [f'Item {n}' for n in range(start, start + count)],
+        'Unit': 1,
+        'Model': 'M-1',
+        'SN/Lot': [f'S{n}' for n in range(start, start + count)],
+        'Remark': '',
+        'Image_URL': '',
+    })
+    return rows.assign(**values)
+
+@pytest.fixture
+def store():
+    return core.InventoryStore(core.clean_dataframe_types(make_rows(5)))
+
+@pytest.fixture
+def journal(tmp_path):
+    return core.InventoryJournal(tmp_path, compact_after=1)
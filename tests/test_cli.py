@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+from io import BytesIO
+
+import pandas as pd
+import pytest
+import requests
+
+import inventory_cli as cli
+import inventory_core as core
+from conftest import make_rows
+
+@pytest.fixture
+def data_dir(tmp_path):
+    rows = pd.concat([make_rows(3, Unit=2), make_rows(2, location='B2', start=3, Image_URL='https://example.com/x.jpg')])
+    core.InventoryJournal(tmp_path).compact(core.InventoryStore(core.clean_dataframe_types(rows)))
+    return tmp_path
+
+@pytest.fixture
+def api(data_dir):
+    server = cli.InventoryServer(('127.0.0.1', 0), cli.InventoryService(data_dir, reload_interval=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+def test_search_returns_ranked_items_up_to_the_limit(api):
+    response = requests.get(f'{api}/search', params={'q': 'item 1', 'limit': 1}, timeout=5)
+    assert response.headers['Content-Type'] == cli.JSON_CONTENT_TYPE
+    payload = response.json()
+    assert (payload['query'], payload['total']) == ('item 1', 1)
+    assert [item['Description'] for item in payload['items']] == ['Item 1']
+    assert requests.get(f'{api}/search', params={'q': 'item'}, timeout=5).json()['total'] == 5
+
+def test_location_lists_the_items_stored_there(api):
+    payload = requests.get(f'{api}/locations/B2', timeout=5).json()
+    assert (payload['location'], payload['position']) == ('B2', 'Lower')
+    assert [item['Description'] for item in payload['items']] == ['Item 3', 'Item 4']
+    assert requests.get(f'{api}/locations/C4', timeout=5).json()['items'] == []
+    locations = requests.get(f'{api}/locations', timeout=5).json()
+    assert locations['A1'] == {'position': 'Bottom', 'items': 3, 'units': 6, 'images': 0}
+    assert locations['B2'] == {'position': 'Lower', 'items': 2, 'units': 2, 'images': 2}
+
+def test_stats_totals_the_inventory_per_room_and_shelf(api):
+    payload = requests.get(f'{api}/stats', timeout=5).json()
+    assert (payload['items'], payload['units'], payload['images'], payload['locations']) == (5, 8, 2, 2)
+    shelves = payload['rooms'][0]['shelves']
+    assert shelves['A'] == {'items': 3, 'units': 6, 'images': 0}
+    assert shelves['B'] == {'items': 2, 'units': 2, 'images': 2}
+
+def test_export_returns_the_inventory_in_the_requested_format(api):
+    response = requests.get(f'{api}/export', params={'format': 'csv'}, timeout=5)
+    assert response.headers['Content-Type'] == 'text/csv'
+    assert 'inventory_data.csv' in response.headers['Content-Disposition']
+    exported = pd.read_csv(BytesIO(response.content))
+    assert exported['Description'].tolist() == [f'Item {n}' for n in range(5)]
+    assert core.ROW_ID_COLUMN not in exported.columns
+    xlsx = requests.get(f'{api}/export', timeout=5)
+    assert len(pd.read_excel(BytesIO(xlsx.content))) == 5
+
+@pytest.mark.parametrize('path, params', [
+    ('search', {'q': 'item', 'limit': 0}),
+    ('search', {'q': 'item', 'limit': 'ten'}),
+    ('export', {'format': 'docx'}),
+])
+def test_bad_parameters_are_rejected(api, path, params):
+    response = requests.get(f'{api}/{path}', params=params, timeout=5)
+    assert response.status_code == 400
+    assert 'error' in response.json()
+
+def test_unknown_endpoints_are_not_found(api):
+    assert requests.get(f'{api}/items', timeout=5).status_code == 404
+
+def test_server_reloads_after_the_journal_changes(api, data_dir):
+    assert requests.get(f'{api}/stats', timeout=5).json()['items'] == 5
+    journal = core.InventoryJournal(data_dir)
+    shared = core.SharedInventory(journal.load(), journal)
+    fork = shared.snapshot()[0].fork()
+    fork.add_rows(make_rows(1, start=10))
+    shared.publish(fork)
+    deadline = time.monotonic() + 5
+    while requests.get(f'{api}/stats', timeout=5).json()['items'] != 6:
+        assert time.monotonic() < deadline, "the server did not pick up the saved change"
+        time.sleep(0.05)
+    assert requests.get(f'{api}/search', params={'q': 'item 10'}, timeout=5).json()['total'] == 1
+
+def test_cli_prints_json_and_writes_exports(data_dir, tmp_path, capsys):
+    cli.main(['--data-dir', str(data_dir), 'search', 'item 4'])
+    assert [item['Location'] for item in json.loads(capsys.readouterr().out)['items']] == ['B2']
+    cli.main(['--data-dir', str(data_dir), 'stats'])
+    assert json.loads(capsys.readouterr().out)['units'] == 8
+    output = tmp_path / 'inventory.parquet'
+    cli.main(['--data-dir', str(data_dir), 'export', '--format', 'parquet', '--output', str(output)])
+    assert len(pd.read_parquet(output)) == 5
@@ -0,0 +1,51 @@
+import pandas as pd
+
+import inventory_core as core
+from conftest import make_rows
+
+def run_import(store, rows, **kwargs):
+    bulk_import = core.InventoryImport(store, **kwargs)
+    bulk_import.feed(rows.astype(str), 'rows.csv')
+    return bulk_import
+
+def test_import_forks_the_snapshot_only_when_it_writes(store):
+    store.read_only = True
+    forks = []
+
+    def editable():
+        forks.append(store.fork())
+        return forks[-1]
+
+    unchanged = run_import(store, core.logical_frame(store.df.drop(columns=core.ROW_ID_COLUMN)), editable=editable)
+    assert unchanged.summary()['Unchanged'] == 5
+    assert forks == []
+
+    changed = run_import(store, make_rows(1, start=10), editable=editable)
+    assert len(forks) == 1
+    assert changed.store is forks[0]
+    assert changed.summary()['Inserted'] == 1
+    assert len(store) == 5 and len(forks[0]) == 6
+
+def test_import_updates_matched_rows_and_inserts_the_rest(store):
+    rows = pd.concat([make_rows(1, Remark='checked'), make_rows(1, start=10)])
+    summary = run_import(store, rows).summary()
+    assert (summary['Updated'], summary['Inserted']) == (1, 1)
+    assert store.df.at[0, 'Remark'] == 'checked'
+
+def test_import_keeps_the_stored_spelling_of_a_matched_sn_lot(store):
+    rows = make_rows(1, **{'SN/Lot': '  s0 ', 'Remark': 'checked'})
+    summary = run_import(store, rows).summary()
+    assert summary['Updated'] == 1
+    assert (store.df.at[0, 'SN/Lot'], store.df.at[0, 'Remark']) == ('S0', 'checked')
+    assert run_import(store, make_rows(1, **{'SN/Lot': 's0', 'Remark': 'checked'})).summary()['Unchanged'] == 1
+
+def test_csv_rows_are_labelled_by_their_line_across_blank_lines_and_chunks(tmp_path, store):
+    path = tmp_path / 'rows.csv'
+    path.write_text('Location,Description,Unit\nA1,a,1\n\nA1,b,x\n\n\nA1,c,2\n', encoding='utf-8')
+    chunks = list(core.read_import_chunks(path, chunk_rows=2))
+    assert [chunk.index.tolist() for chunk in chunks] == [[2], [4], [7]]
+    bulk_import = core.InventoryImport(store)
+    for chunk in chunks:
+        bulk_import.feed(chunk, path.name)
+    assert bulk_import.issues_frame()[['Row', 'Column', 'Value']].values.tolist() == [[4, 'Unit', 'x']]
+    assert bulk_import.summary()['Inserted'] == 2
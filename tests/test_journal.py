@@ -0,0 +1,71 @@
+import os
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import inventory_core as core
+from conftest import make_rows
+
+def test_xlsx_snapshot_keeps_cells_as_text(tmp_path):
+    rows = make_rows(5, Image_URL=[f'https://images.example.com/{n}.jpg' for n in range(5)])
+    rows.loc[0, 'SN/Lot'] = '=1+1'
+    rows.loc[1, 'Remark'] = '=HYPERLINK("http://example.com")'
+    store = core.InventoryStore(core.clean_dataframe_types(rows))
+    journal = core.InventoryJournal(tmp_path, snapshot_format='xlsx')
+    journal.compact(store)
+    loaded = core.InventoryJournal(tmp_path, snapshot_format='xlsx').load()
+    assert core.logical_frame(loaded.df).equals(core.logical_frame(store.df))
+
+def test_xlsx_snapshot_keeps_urls_beyond_the_worksheet_limit(tmp_path):
+    # xlsxwriter turns at most 65,530 strings per sheet into links and silently drops the rest
+    count = core.EXCEL_MAX_URLS + 10
+    rows = pd.DataFrame({
+        'Location': 'A1', 'Description': 'Item', 'Unit': 1, 'Model': '', 'SN/Lot': '', 'Remark': '',
+        'Image_URL': [f'https://images.example.com/{n}.jpg' for n in range(count)],
+    })
+    store = core.InventoryStore(core.clean_dataframe_types(rows))
+    core.InventoryJournal(tmp_path, snapshot_format='xlsx').compact(store)
+    loaded = core.InventoryJournal(tmp_path, snapshot_format='xlsx').load()
+    assert (loaded.df['Image_URL'] != '').sum() == count
+
+def test_excel_export_writes_leading_equals_as_text():
+    rows = core.clean_dataframe_types(make_rows(1, **{'SN/Lot': '=1+1'}))
+    exported = pd.read_excel(BytesIO(core.convert_df_to_excel(rows)))
+    assert exported.at[0, 'SN/Lot'] == '=1+1'
+
+def test_recorded_changes_round_trip_through_the_journal(tmp_path):
+    base = core.InventoryStore(core.clean_dataframe_types(make_rows(3)))
+    journal = core.InventoryJournal(tmp_path)
+    journal.compact(base)
+    store = base.fork()
+    store.add_rows(make_rows(2, location='B2', start=10))
+    store.update_cells({'Unit': pd.Series({0: 4, 3: 2}), 'Remark': pd.Series({1: 'checked'})})
+    store.delete_rows([2])
+    # Added rows and updated cells are kept columnar until they are written
+    assert isinstance(store.pending_changes[0]['rows'], pd.DataFrame)
+    assert isinstance(store.pending_changes[1]['changes']['Unit'], pd.Series)
+    journal.append(store.pending_changes)
+    loaded = core.InventoryJournal(tmp_path).load()
+    assert core.logical_frame(loaded.df).equals(core.logical_frame(store.df))
+
+@pytest.mark.parametrize('snapshot_format', ['sqlite', 'xlsx'])
+def test_compaction_syncs_the_snapshot_before_rewriting_the_journal(tmp_path, monkeypatch, snapshot_format):
+    base = core.InventoryStore(core.clean_dataframe_types(make_rows(3)))
+    journal = core.InventoryJournal(tmp_path / 'data', snapshot_format=snapshot_format)
+    journal.compact(base)
+    store = base.fork()
+    store.update_cells({'Remark': pd.Series({0: 'saved'})})
+    journal.append(store.pending_changes)
+    events = []
+    fsync_path, replace = core._fsync_path, os.replace
+    monkeypatch.setattr(core, '_fsync_path', lambda path: (events.append(('fsync', Path(path).name)), fsync_path(path)))
+    monkeypatch.setattr(core.os, 'replace', lambda src, dst: (events.append(('replace', Path(dst).name)), replace(src, dst)))
+    journal.compact(store)
+    snapshot = f'snapshot.{snapshot_format}'
+    assert events == [
+        ('fsync', f'{snapshot}.tmp'), ('replace', snapshot), ('fsync', 'data'),
+        ('fsync', 'journal.jsonl.tmp'), ('replace', 'journal.jsonl'), ('fsync', 'data'),
+    ]
+    assert core.InventoryJournal(tmp_path / 'data', snapshot_format=snapshot_format).load().df.at[0, 'Remark'] == 'saved'
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+
+import inventory_core as core
+from conftest import make_rows
+
+URL = 'https://example.com/x.jpg'
+
+@pytest.fixture
+def shelves():
+    rows = pd.concat([make_rows(3, Unit=2), make_rows(2, location='B2', start=3, Image_URL=URL)])
+    return core.InventoryStore(core.clean_dataframe_types(rows))
+
+def recounted(store):
+    """location_stats computed from scratch over the stored rows"""
+    return core.InventoryStore(core.logical_frame(store.df)).location_stats()
+
+def test_stats_count_rows_units_and_images(shelves):
+    assert shelves.location_stats() == {'A1': (3, 6, 0), 'B2': (2, 2, 2)}
+
+@pytest.mark.parametrize('dtype', ['string', 'category'])
+def test_blank_and_nan_urls_are_not_images(dtype):
+    urls = pd.Series([URL, '', '   ', 'nan', None, f' {URL} '], dtype=dtype)
+    assert core.image_url_mask(urls).tolist() == [True, False, False, False, False, True]
+
+def test_moving_a_row_moves_its_totals(shelves):
+    shelves.update_cells({'Location': pd.Series({0: 'B2', 1: 'C4'})})
+    assert shelves.location_stats() == {'A1': (1, 2, 0), 'B2': (3, 4, 2), 'C4': (1, 2, 0)}
+    assert shelves.location_stats() == recounted(shelves)
+
+def test_unit_and_image_edits_update_the_totals(shelves):
+    shelves.update_cells({'Unit': pd.Series({0: 10, 3: 0}), 'Image_URL': pd.Series({1: URL, 4: ''})})
+    assert shelves.location_stats() == {'A1': (3, 14, 1), 'B2': (2, 1, 1)}
+    shelves.update_cells({'Location': pd.Series({1: 'B2'}), 'Unit': pd.Series({1: 5})})
+    assert shelves.location_stats() == {'A1': (2, 12, 0), 'B2': (3, 6, 2)}
+    assert shelves.location_stats() == recounted(shelves)
+
+def test_emptied_locations_drop_out(shelves):
+    shelves.delete_rows([3, 4])
+    assert shelves.location_stats() == {'A1': (3, 6, 0)}
+    shelves.update_cells({'Location': pd.Series({0: 'B2', 1: 'B2', 2: 'B2'})})
+    assert shelves.location_stats() == {'B2': (3, 6, 0)}
+    assert shelves.location_labels('A1') == []
+
+def test_fork_edits_leave_the_snapshots_totals_alone(shelves):
+    fork = shelves.fork()
+    fork.update_cells({'Location': pd.Series({3: 'A1'}), 'Unit': pd.Series({0: 7})})
+    fork.delete_rows([4])
+    fork.add_rows(core.clean_dataframe_types(make_rows(1, location='C4', start=5)))
+    assert fork.location_stats() == {'A1': (4, 12, 1), 'C4': (1, 1, 0)}
+    assert fork.location_stats() == recounted(fork)
+    assert shelves.location_stats() == {'A1': (3, 6, 0), 'B2': (2, 2, 2)}
@@ -0,0 +1,51 @@
+import pandas as pd
+import pytest
+
+import inventory_core as core
+from conftest import make_rows
+
+@pytest.fixture
+def shelves():
+    rows = pd.concat([make_rows(3), make_rows(2, location='B2', start=3), make_rows(1, location='C4', start=1)])
+    return core.InventoryStore(core.clean_dataframe_types(rows))
+
+def statuses(sheet):
+    return sheet[['Scanned', 'Scans', 'Status', 'Location']].values.tolist()
+
+def test_parse_scanned_codes_splits_on_lines_and_separators():
+    assert core.parse_scanned_codes(' S0\r\nS1, S2;\tS3\n\n ,') == ['S0', 'S1', 'S2', 'S3']
+
+def test_scanned_codes_are_found_at_their_location(shelves):
+    sheet = core.reconcile_scans(shelves, ['S3', 's0 '])
+    assert statuses(sheet) == [['S3', 1, 'Found', 'B2'], ['s0 ', 1, 'Found', 'A1']]
+    assert sheet['Description'].tolist() == ['Item 3', 'Item 0']
+    assert sheet['Unit'].dtype == 'Int64'
+
+def test_unknown_codes_are_missing(shelves):
+    sheet = core.reconcile_scans(shelves, ['S9', 'S4'])
+    assert statuses(sheet)[0][:3] == ['S9', 1, 'Missing']
+    assert sheet['Location'].isna().tolist() == [True, False]
+    assert sheet['Unit'].isna().tolist() == [True, False]
+
+def test_codes_stored_at_several_locations_list_every_row(shelves):
+    sheet = core.reconcile_scans(shelves, ['S1'])
+    assert statuses(sheet) == [['S1', 1, 'Duplicate locations', 'A1'], ['S1', 1, 'Duplicate locations', 'C4']]
+
+def test_repeated_scans_are_counted_once_per_code(shelves):
+    sheet = core.reconcile_scans(shelves, ['s2', 'S2', ' S2', 'S7', 's7'])
+    assert statuses(sheet)[0] == ['s2', 3, 'Found', 'A1']
+    assert statuses(sheet)[1][:3] == ['S7', 2, 'Missing']
+    assert len(sheet) == 2
+
+def test_unscanned_rows_of_counted_locations_are_listed(shelves):
+    sheet = core.reconcile_scans(shelves, ['S3', 'S0'], counted_locations=['B2', 'A1'])
+    assert statuses(sheet) == [
+        ['S3', 1, 'Found', 'B2'], ['S0', 1, 'Found', 'A1'],
+        ['', 0, 'Not scanned', 'B2'], ['', 0, 'Not scanned', 'A1'], ['', 0, 'Not scanned', 'A1'],
+    ]
+    assert sheet['Description'].tolist()[2:] == ['Item 4', 'Item 1', 'Item 2']
+
+def test_no_codes_give_an_empty_sheet(shelves):
+    sheet = core.reconcile_scans(shelves, [])
+    assert sheet.empty
+    assert list(sheet.columns) == ['Scanned', 'Scans', 'Status', *core.INVENTORY_SCHEMA]
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pandas as pd
+
+import inventory_core as core
+from conftest import make_rows
+
+def snapshot(rows):
+    store = core.InventoryStore(core.clean_dataframe_types(rows))
+    store.search_index, store.serial_index
+    store.read_only = True
+    return store
+
+def descriptions(store, query):
+    return store.search(query)[0]['Description'].tolist()
+
+def test_search_ranks_exact_prefix_word_start_then_substring():
+    store = snapshot(make_rows(5, Description=['Tip', 'Suction Tip', 'Tipset', 'Multip', 'Tip']))
+    labels, total = store.search_index.search('TIP')
+    assert (labels, total) == ([0, 4, 2, 1, 3], 5)
+    assert store.search_index.search('tip', limit=2) == ([0, 4], 5)
+
+def test_search_matches_any_searchable_column_once_per_row():
+    store = snapshot(make_rows(3, Model=['M-1', 'AB-9', 'M-1'], **{'SN/Lot': ['ab', 'S1', 'S2']}))
+    assert store.search_index.search('ab') == ([0, 1], 2)
+    assert store.search_index.search('m-1') == ([0, 2], 2)
+    # Remark and Location are not searched
+    assert store.search_index.search('a1') == ([], 0)
+
+def test_search_index_follows_edits_and_rebuilds_from_used_values(monkeypatch):
+    monkeypatch.setattr(core.SearchIndex, 'FOLD_MIN', 2)
+    folds = []
+    fold = core.SearchIndex._fold
+    monkeypatch.setattr(core.SearchIndex, '_fold', lambda self: (folds.append(1), fold(self)))
+    store = core.InventoryStore(core.clean_dataframe_types(make_rows(3)))
+    store.search_index
+    store.update_cells({'Description': pd.Series({0: 'Widget', 1: 'Gadget'})})
+    store.delete_rows([2])
+    store.add_rows(make_rows(2, start=7, Description='Widget'))
+    assert folds
+    assert descriptions(store, 'dget') == ['Widget', 'Gadget', 'Widget', 'Widget']
+    assert descriptions(store, 'item') == []
+    assert store.search('s8')[0].index.tolist() == [4]
+
+def counting_builds(monkeypatch, index_class):
+    builds = []
+    init = index_class.__init__
+
+    def build(self, df):
+        builds.append(len(df))
+        time.sleep(0.05)
+        init(self, df)
+
+    monkeypatch.setattr(index_class, '__init__', build)
+    return builds
+
+def test_concurrent_first_searches_build_the_index_once(monkeypatch):
+    builds = counting_builds(monkeypatch, core.SearchIndex)
+    store = core.InventoryStore(core.clean_dataframe_types(make_rows(5)))
+    store.read_only = True
+    threads = [threading.Thread(target=store.search, args=('item',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == [5]
+
+def test_fork_taken_before_the_index_exists_uses_the_snapshots(monkeypatch):
+    search_builds = counting_builds(monkeypatch, core.SearchIndex)
+    serial_builds = counting_builds(monkeypatch, core.SerialIndex)
+    base = core.InventoryStore(core.clean_dataframe_types(make_rows(5)))
+    base.read_only = True
+    unchanged, edited = base.fork(), base.fork()
+    edited.update_cells({'Description': pd.Series({0: 'Widget'}), 'SN/Lot': pd.Series({1: 'S0'})})
+    assert unchanged.search_index is base.search_index
+    assert descriptions(edited, 'widget') == ['Widget']
+    assert edited.find_serials(['S0']) == {'S0': [0, 1]}
+    assert descriptions(base, 'widget') == []
+    assert base.find_serials(['S0']) == {'S0': [0]}
+    assert search_builds == serial_builds == [5]
+
+def rebuilt(self, df):
+    raise AssertionError('index was rebuilt')
+
+def test_fork_updates_copies_of_the_shared_indexes(monkeypatch):
+    base = snapshot(make_rows(5))
+    fork = base.fork()
+    for index in (core.SearchIndex, core.SerialIndex):
+        monkeypatch.setattr(index, '__init__', rebuilt)
+    fork.update_cells({'Description': pd.Series({0: 'Widget'}), 'SN/Lot': pd.Series({1: 'S0'})})
+    fork.delete_rows([2])
+    ids, _ = fork.add_rows(make_rows(1, start=9, Description='Widget 2'))
+    assert descriptions(fork, 'widget') == ['Widget', 'Widget 2']
+    assert descriptions(fork, 'item 2') == []
+    assert fork.find_serials(['S0', 'S2', 'S9']) == {'S0': [0, 1], 'S2': [], 'S9': ids}
+    assert descriptions(base, 'widget') == []
+    assert descriptions(base, 'item 2') == ['Item 2']
+    assert base.find_serials(['S0', 'S1', 'S2', 'S9']) == {'S0': [0], 'S1': [1], 'S2': [2], 'S9': []}
+
+def test_forks_of_one_snapshot_do_not_see_each_others_edits():
+    base = snapshot(make_rows(3))
+    first, second = base.fork(), base.fork()
+    first.update_cells({'Description': pd.Series({0: 'Widget'})})
+    second.update_cells({'Description': pd.Series({1: 'Widget'})})
+    assert first.search('widget')[0].index.tolist() == [0]
+    assert second.search('widget')[0].index.tolist() == [1]
+    assert descriptions(base, 'item') == ['Item 0', 'Item 1', 'Item 2']
+
+def test_memory_breakdown_counts_indexes_once_per_owner():
+    base = snapshot(make_rows(200))
+    parts = base.memory_breakdown()
+    assert min(parts['search_index'], parts['serial_index'], parts['location_index']) > 0
+    assert base.memory_usage() == sum(parts.values()) == core.estimate_size(base)
+    fork = base.fork()
+    assert fork.memory_breakdown()['search_index'] == fork.memory_breakdown()['serial_index'] == 0
+    fork.update_cells({'Description': pd.Series({0: 'Widget'}), 'SN/Lot': pd.Series({0: 'S9'})})
+    copied = fork.memory_breakdown()
+    # The copies own the per-row arrays and changed SN/Lot entries, not the snapshot's postings
+    assert 0 < copied['search_index'] < parts['search_index']
+    assert 0 < copied['serial_index'] < parts['serial_index']
+    assert copied['location_index'] == parts['location_index']
@@ -0,0 +1,232 @@
+import threading
+
+import pandas as pd
+import pytest
+
+import inventory_core as core
+from conftest import make_rows
+
+def remark(store, row_id):
+    return store.df.at[row_id, 'Remark']
+
+def edit(store, col, values):
+    fork = store.fork()
+    fork.update_cells({col: pd.Series(values)})
+    return fork
+
+# merge_changes
+
+def test_merge_applies_changes_to_rows_nobody_else_touched(store):
+    shared = core.SharedInventory(store)
+    mine = edit(store, 'Remark', {0: 'mine'})
+    shared.publish(edit(store, 'Remark', {1: 'theirs'}))
+    version, conflicts = shared.publish(mine)
+    current, _ = shared.snapshot()
+    assert conflicts.empty
+    assert (remark(current, 0), remark(current, 1)) == ('mine', 'theirs')
+    assert version == 2
+
+def test_merge_keeps_edits_to_different_cells_of_the_same_row(store):
+    shared = core.SharedInventory(store)
+    mine = edit(store, 'Remark', {0: 'mine'})
+    shared.publish(edit(store, 'Unit', {0: 7}))
+    _, conflicts = shared.publish(mine)
+    current, _ = shared.snapshot()
+    assert conflicts.empty
+    assert (remark(current, 0), current.df.at[0, 'Unit']) == ('mine', 7)
+
+def test_merge_reports_conflicting_cell_edits_without_applying_them(store):
+    shared = core.SharedInventory(store)
+    mine = edit(store, 'Remark', {0: 'mine', 1: 'also mine'})
+    shared.publish(edit(store, 'Remark', {0: 'theirs'}))
+    _, conflicts = shared.publish(mine)
+    current, _ = shared.snapshot()
+    assert conflicts[['Row ID', 'Column', 'Your value', 'Current value']].values.tolist() == [
+        [0, 'Remark', 'mine', 'theirs']
+    ]
+    assert (remark(current, 0), remark(current, 1)) == ('theirs', 'also mine')
+
+def test_merge_accepts_the_same_edit_made_by_both_sides(store):
+    shared = core.SharedInventory(store)
+    mine = edit(store, 'Remark', {0: 'same'})
+    shared.publish(edit(store, 'Remark', {0: 'same'}))
+    _, conflicts = shared.publish(mine)
+    assert conflicts.empty
+
+def test_merge_reports_deleting_a_row_edited_by_someone_else(store):
+    shared = core.SharedInventory(store)
+    mine = store.fork()
+    mine.delete_rows([0, 1])
+    shared.publish(edit(store, 'Remark', {0: 'theirs'}))
+    _, conflicts = shared.publish(mine)
+    current, _ = shared.snapshot()
+    assert conflicts['Problem'].tolist() == ['row was edited by another user']
+    assert 0 in current.df.index and 1 not in current.df.index
+
+def test_merge_reports_editing_a_row_deleted_by_someone_else(store):
+    shared = core.SharedInventory(store)
+    mine = edit(store, 'Remark', {0: 'mine'})
+    theirs = store.fork()
+    theirs.delete_rows([0])
+    shared.publish(theirs)
+    _, conflicts = shared.publish(mine)
+    current, _ = shared.snapshot()
+    assert conflicts['Problem'].tolist() == ['row was deleted by another user']
+    assert 0 not in current.df.index
+
+def test_merge_keeps_rows_added_by_both_sides(store):
+    shared = core.SharedInventory(store)
+    mine, theirs = store.fork(), store.fork()
+    mine_ids, _ = mine.add_rows(make_rows(2, start=10))
+    theirs_ids, _ = theirs.add_rows(make_rows(1, start=20))
+    shared.publish(theirs)
+    _, conflicts = shared.publish(mine)
+    current, _ = shared.snapshot()
+    assert conflicts.empty
+    assert set(mine_ids + theirs_ids) <= set(current.df.index)
+    assert len(current) == 8
+
+# publish and compaction
+
+def test_saved_edits_survive_a_reload(store, journal):
+    shared = core.SharedInventory(store, journal)
+    shared.publish(edit(store, 'Remark', {0: 'saved'}))
+    fork = shared.snapshot()[0].fork()
+    fork.add_rows(make_rows(1, start=10))
+    shared.publish(fork)
+    with journal._compact_lock:
+        pass
+    loaded = core.InventoryJournal(journal.data_dir).load()
+    assert remark(loaded, 0) == 'saved'
+    assert len(loaded) == 6
+
+def test_compaction_started_late_keeps_records_published_after_its_store(store, journal):
+    # Session A's compaction runs only after session B appended its record
+    shared = core.SharedInventory(store, journal)
+    maybe_compact = journal.maybe_compact
+    a_may_compact, a_compacted = threading.Event(), threading.Event()
+
+    def interleaved(candidate, seq):
+        if threading.current_thread().name == 'A':
+            a_may_compact.wait(5)
+            maybe_compact(candidate, seq)
+            a_compacted.set()
+        else:
+            a_may_compact.set()
+            a_compacted.wait(5)
+            maybe_compact(candidate, seq)
+
+    journal.maybe_compact = interleaved
+    a = threading.Thread(target=shared.publish, args=(edit(store, 'Remark', {0: 'A'}),), name='A')
+    a.start()
+    while journal.seq < 1:
+        pass
+    shared.publish(edit(shared.snapshot()[0], 'Remark', {1: 'B'}))
+    a.join()
+    with journal._compact_lock:
+        pass
+    loaded = core.InventoryJournal(journal.data_dir).load()
+    assert (remark(loaded, 0), remark(loaded, 1)) == ('A', 'B')
+
+def test_stale_compaction_does_not_replace_a_newer_snapshot(store, journal):
+    shared = core.SharedInventory(store, journal)
+    shared.publish(edit(store, 'Remark', {0: 'first'}))
+    with journal._compact_lock:
+        pass
+    older, older_seq = shared.snapshot()[0], journal.seq
+    shared.publish(edit(older, 'Remark', {1: 'second'}))
+    with journal._compact_lock:
+        pass
+    with journal._compact_lock:
+        journal._compact(older, older_seq)
+    loaded = core.InventoryJournal(journal.data_dir).load()
+    assert (remark(loaded, 0), remark(loaded, 1)) == ('first', 'second')
+
+def test_concurrent_publishes_all_reach_the_journal(store, tmp_path):
+    journal = core.InventoryJournal(tmp_path, compact_after=3)
+    shared = core.SharedInventory(store, journal)
+
+    def save(row_id):
+        for n in range(5):
+            shared.publish(edit(shared.snapshot()[0], 'Remark', {row_id: f'{row_id}-{n}'}))
+
+    threads = [threading.Thread(target=save, args=(row_id,)) for row_id in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with journal._compact_lock:
+        pass
+    loaded = core.InventoryJournal(tmp_path).load()
+    assert [remark(loaded, row_id) for row_id in range(5)] == [f'{row_id}-4' for row_id in range(5)]
+
+# replacing the snapshot (Refresh from GitHub)
+
+def reloaded(rows):
+    return core.InventoryStore(core.clean_dataframe_types(rows))
+
+def test_replace_keeps_row_ids_unique_across_generations(store):
+    shared = core.SharedInventory(store)
+    old_fork = store.fork()
+    shared.publish(reloaded(make_rows(3, start=100)), replace=True)
+    new_fork = shared.snapshot()[0].fork()
+    old_ids, _ = old_fork.add_rows(make_rows(1, start=10))
+    new_ids, _ = new_fork.add_rows(make_rows(1, start=20))
+    assert not set(old_ids) & set(new_ids)
+    assert not set(new_ids) & set(store.df.index)
+
+def test_publishing_a_fork_from_before_a_replace_reports_every_change(store):
+    shared = core.SharedInventory(store)
+    old_fork = store.fork()
+    old_fork.update_cells({'Remark': pd.Series({0: 'mine'})})
+    old_fork.delete_rows([1])
+    added, _ = old_fork.add_rows(make_rows(1, start=10))
+    version, _ = shared.publish(reloaded(make_rows(3, start=100)), replace=True)
+    new_version, conflicts = shared.publish(old_fork)
+    current, _ = shared.snapshot()
+    assert new_version == version
+    assert sorted(conflicts['Row ID']) == sorted([0, 1] + added)
+    assert conflicts['Problem'].str.contains('reloaded').all()
+    assert current.df['Description'].tolist() == ['Item 100', 'Item 101', 'Item 102']
+
+def test_forks_of_the_replaced_snapshot_still_merge(store):
+    shared = core.SharedInventory(store)
+    shared.publish(reloaded(make_rows(3, start=100)), replace=True)
+    first, second = shared.snapshot()[0].fork(), shared.snapshot()[0].fork()
+    first.update_cells({'Remark': pd.Series({0: 'first'})})
+    second.update_cells({'Remark': pd.Series({1: 'second'})})
+    shared.publish(first)
+    _, conflicts = shared.publish(second)
+    current, _ = shared.snapshot()
+    assert conflicts.empty
+    assert (remark(current, 0), remark(current, 1)) == ('first', 'second')
+
+def test_merging_an_added_row_under_a_used_id_is_a_conflict(store):
+    fork = store.fork()
+    fork.add_rows(make_rows(1, start=10))
+    change = fork.pending_changes[-1]
+    change = {**change, 'rows': change['rows'].assign(**{core.ROW_ID_COLUMN: 0})}
+    target = store.fork()
+    conflicts = target.merge_changes([change], store)
+    assert conflicts[['Row ID', 'Problem']].values.tolist() == [[0, 'row ID is already used by another item']]
+    assert target.df.at[0, 'Description'] == 'Item 0'
+
+def test_replace_refuses_to_discard_saved_changes(store, journal):
+    shared = core.SharedInventory(store, journal)
+    shared.publish(edit(store, 'Remark', {0: 'saved'}))
+    with pytest.raises(RuntimeError, match='1 saved change'):
+        shared.publish(reloaded(make_rows(3, start=100)), replace=True)
+    assert remark(shared.snapshot()[0], 0) == 'saved'
+    shared.publish(reloaded(make_rows(3, start=100)), replace=True, discard_saved=True)
+    assert shared.saved_changes == 0
+    assert len(core.InventoryJournal(journal.data_dir).load()) == 3
+
+def test_saved_changes_are_counted_across_restarts(store, journal):
+    shared = core.SharedInventory(store, journal)
+    shared.publish(reloaded(make_rows(3)), replace=True)
+    shared.publish(edit(shared.snapshot()[0], 'Remark', {0: 'a'}))
+    shared.publish(edit(shared.snapshot()[0], 'Remark', {1: 'b'}))
+    with journal._compact_lock:
+        pass
+    restarted = core.InventoryJournal(journal.data_dir)
+    assert core.SharedInventory(restarted.load(), restarted).saved_changes == 2
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from inventory_thumbnails import ThumbnailService
+
+def image_bytes(size, mode='RGB', format='PNG'):
+    output = BytesIO()
+    Image.new(mode, size, 'red' if mode == 'RGB' else (255, 0, 0, 128)).save(output, format=format)
+    return output.getvalue()
+
+IMAGES = {
+    '/large.png': image_bytes((1200, 900)),
+    '/small.jpg': image_bytes((40, 30), format='JPEG'),
+    '/transparent.png': image_bytes((50, 50), mode='RGBA'),
+    '/broken.jpg': b'not an image',
+}
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves IMAGES, 404 for anything else; /slow* paths answer after ``delay`` seconds"""
+
+    hits = Counter()
+    delay = 0.5
+
+    def do_GET(self):
+        self.hits[self.path] += 1
+        if self.path.startswith('/slow'):
+            time.sleep(self.delay)
+        body = IMAGES.get(self.path.removeprefix('/slow'))
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def base_url():
+    ImageHandler.hits = Counter()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+def service(tmp_path, **kwargs):
+    return ThumbnailService(cache_dir=tmp_path / 'thumbnails', timeout=(2, 2), **kwargs)
+
+def test_thumbnails_are_downscaled_jpegs(base_url, tmp_path):
+    thumbnails = service(tmp_path, thumbnail_size=(300, 300))
+    urls = [f'{base_url}/large.png', f'{base_url}/small.jpg', f'{base_url}/transparent.png']
+    result = thumbnails.get_many(urls)
+    sizes = {url: Image.open(BytesIO(data)).size for url, data in result.items()}
+    assert sizes == {urls[0]: (300, 225), urls[1]: (40, 30), urls[2]: (50, 50)}
+    assert all(Image.open(BytesIO(data)).format == 'JPEG' for data in result.values())
+
+def test_concurrent_requests_for_a_url_fetch_it_once(base_url, tmp_path):
+    thumbnails = service(tmp_path)
+    url = f'{base_url}/slow/large.png'
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(thumbnails.get_many([url])[url])) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert ImageHandler.hits['/slow/large.png'] == 1
+    assert all(data is not None for data in results)
+    # Later calls are served from the cache
+    thumbnails.get_many([url])
+    assert ImageHandler.hits['/slow/large.png'] == 1
+
+def test_failed_urls_are_skipped_until_their_ttl_expires(base_url, tmp_path):
+    thumbnails = service(tmp_path, failure_ttl=0.3)
+    urls = [f'{base_url}/missing.jpg', f'{base_url}/broken.jpg']
+    assert thumbnails.get_many(urls) == {url: None for url in urls}
+    assert all(thumbnails.failed(url) for url in urls)
+    thumbnails.get_many(urls)
+    assert (ImageHandler.hits['/missing.jpg'], ImageHandler.hits['/broken.jpg']) == (1, 1)
+    time.sleep(0.35)
+    thumbnails.get_many(urls)
+    assert (ImageHandler.hits['/missing.jpg'], ImageHandler.hits['/broken.jpg']) == (2, 2)
+
+def test_slow_thumbnails_are_none_until_loaded(base_url, tmp_path):
+    thumbnails = service(tmp_path)
+    url = f'{base_url}/slow/small.jpg'
+    assert thumbnails.get_many([url], wait_seconds=0.05) == {url: None}
+    time.sleep(ImageHandler.delay + 0.3)
+    assert thumbnails.cached(url) is not None
+
+def test_cache_evicts_least_recently_used_thumbnails_over_the_byte_cap(base_url, tmp_path):
+    large, transparent, small = (f'{base_url}{path}' for path in ('/large.png', '/transparent.png', '/small.jpg'))
+    sizes = {url: len(data) for url, data in service(tmp_path / 'sizes').get_many([large, transparent, small]).items()}
+    service(tmp_path).get_many([large, transparent])
+    # A new service picks up the cached files; its cap leaves room for only two of the three
+    capped = service(tmp_path, max_bytes=sizes[large] + sizes[small])
+    capped.cached(large)
+    capped.get_many([small])
+    assert capped.cached(large) is not None and capped.cached(small) is not None
+    assert capped.cached(transparent) is None
+    assert len(list((tmp_path / 'thumbnails').glob('*.jpg'))) == 2
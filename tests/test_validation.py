@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import inventory_core as core
+from conftest import make_rows
+
+def test_valid_rows_are_coerced_to_the_storage_schema():
+    rows = make_rows(2, Unit=['3', ''], Remark=[np.nan, 'ok'])
+    valid, issues = core.validate_inventory_rows(rows)
+    assert issues.empty
+    assert valid['Unit'].tolist() == [3, 0]
+    assert valid['Remark'].tolist() == ['', 'ok']
+    expected = {col: str(pd.Series([], dtype=dtype).dtype) for col, dtype in core.STORAGE_SCHEMA.items()}
+    assert valid.dtypes.astype(str).to_dict() == expected
+
+@pytest.mark.parametrize('unit, problem', [
+    ('ten', 'not a number'),
+    (-1, 'not a non-negative whole number'),
+    (1.5, 'not a non-negative whole number'),
+    (core.UNIT_MAX + 1, f'larger than {core.UNIT_MAX}'),
+])
+def test_bad_units_are_rejected(unit, problem):
+    rows = make_rows(2, Unit=[1, unit])
+    valid, issues = core.validate_inventory_rows(rows)
+    assert valid['Description'].tolist() == ['Item 0']
+    assert issues.values.tolist() == [[1, 'Unit', str(unit), problem]]
+
+@pytest.mark.parametrize('location', [None, '', '   '])
+def test_rows_without_a_location_are_rejected(location):
+    rows = make_rows(2, Location=['A1', location])
+    valid, issues = core.validate_inventory_rows(rows)
+    assert len(valid) == 1
+    assert issues[['Row', 'Column', 'Problem']].values.tolist() == [[1, 'Location', 'missing location']]
+
+def test_issues_are_one_row_per_problem_in_input_order():
+    rows = make_rows(4, Unit=['x', 1, -2, 1], Location=['', 'A1', '', 'A1']).set_axis([12, 10, 11, 13])
+    valid, issues = core.validate_inventory_rows(rows)
+    assert list(issues.columns) == ['Row', 'Column', 'Value', 'Problem']
+    assert issues[['Row', 'Column']].values.tolist() == [[11, 'Unit'], [11, 'Location'], [12, 'Unit'], [12, 'Location']]
+    assert valid.index.tolist() == [10, 13]
+
+def test_missing_columns_raise():
+    with pytest.raises(ValueError, match='Missing inventory column.*Unit'):
+        core.validate_inventory_rows(make_rows(1).drop(columns='Unit'))
+
+def grid(store):
+    """Grid data as the inventory editor receives it back: plain dtypes, indexed by row ID"""
+    data = core.logical_frame(store.df).reset_index(drop=True)
+    return data.set_axis(data[core.ROW_ID_COLUMN].astype('int64').to_numpy())
+
+def test_unedited_grid_has_no_changes(store):
+    store.update_cells({'Remark': pd.Series({1: 'checked'})})
+    edited, issues = core.validate_inventory_rows(grid(store))
+    assert issues.empty
+    assert core.diff_grid_edits(store.df, edited) == {}
+
+def test_grid_diff_holds_only_the_changed_cells(store):
+    edited = grid(store)
+    edited.loc[1, 'Remark'] = 'checked'
+    edited.loc[3, 'Unit'] = 7
+    edited.loc[3, 'Location'] = 'B2'
+    changes = core.diff_grid_edits(store.df, edited)
+    assert {col: values.to_dict() for col, values in changes.items()} == {
+        'Location': {3: 'B2'}, 'Unit': {3: 7}, 'Remark': {1: 'checked'}
+    }
@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import inventory_core as core
+from conftest import make_rows
+
+WORKBOOK = core.convert_df_to_excel(make_rows(3))
+BUNDLED = core.convert_df_to_excel(make_rows(2, start=50))
+
+LAST_MODIFIED = 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+class WorkbookHandler(BaseHTTPRequestHandler):
+    """Serves WORKBOOK with an ETag and Last-Modified, answering 304 to a matching If-None-Match or If-Modified-Since"""
+
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == '"v1"' or self.headers.get('If-Modified-Since') == LAST_MODIFIED:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(WORKBOOK)))
+        self.end_headers()
+        self.wfile.write(WORKBOOK)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    WorkbookHandler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), WorkbookHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/inventory_data.xlsx'
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def bundled(tmp_path):
+    path = tmp_path / 'bundled.xlsx'
+    path.write_bytes(BUNDLED)
+    return path
+
+def corrupt_cache(cache_dir, url, fetched_at):
+    cache_dir.mkdir(exist_ok=True)
+    (cache_dir / 'workbook.xlsx').write_bytes(WORKBOOK[:100])
+    (cache_dir / 'workbook.parquet').write_bytes(b'not parquet')
+    (cache_dir / 'workbook.json').write_text(json.dumps({'url': url, 'etag': '"v1"', 'fetched_at': fetched_at}))
+
+def fetch(url, cache_dir, bundled):
+    return core.fetch_inventory_workbook(url=url, cache_dir=cache_dir, fallback_file=bundled, timeout=(1, 1), ttl=60)
+
+def expire_cache(cache_dir, drop=()):
+    """Age the cached metadata past the TTL, optionally dropping some of its fields"""
+    meta_path = cache_dir / 'workbook.json'
+    meta = {key: value for key, value in json.loads(meta_path.read_text()).items() if key not in drop}
+    meta_path.write_text(json.dumps({**meta, 'fetched_at': 0}))
+
+def test_cache_within_ttl_is_used_without_a_request(server, tmp_path, bundled):
+    assert fetch(server, tmp_path / 'cache', bundled)[1] == 'remote'
+    df, source, error = fetch(server, tmp_path / 'cache', bundled)
+    assert (source, error) == ('cache', None)
+    assert df['Description'].tolist() == ['Item 0', 'Item 1', 'Item 2']
+    assert len(WorkbookHandler.requests) == 1
+
+def test_not_modified_reuses_the_sidecar_and_restarts_the_ttl(server, tmp_path, bundled):
+    cache_dir = tmp_path / 'cache'
+    fetch(server, cache_dir, bundled)
+    sidecar_mtime = (cache_dir / 'workbook.parquet').stat().st_mtime_ns
+    expire_cache(cache_dir)
+    started = time.time()
+    df, source, error = fetch(server, cache_dir, bundled)
+    assert (source, error) == ('not-modified', None)
+    assert len(df) == 3
+    assert (cache_dir / 'workbook.parquet').stat().st_mtime_ns == sidecar_mtime
+    assert json.loads((cache_dir / 'workbook.json').read_text())['fetched_at'] >= started
+    assert fetch(server, cache_dir, bundled)[1] == 'cache'
+    assert len(WorkbookHandler.requests) == 2
+
+def test_revalidation_sends_the_cached_validators(server, tmp_path, bundled):
+    cache_dir = tmp_path / 'cache'
+    fetch(server, cache_dir, bundled)
+    assert core.fetch_inventory_workbook(url=server, cache_dir=cache_dir, fallback_file=bundled,
+                                         timeout=(1, 1), ttl=60, revalidate=True)[1] == 'not-modified'
+    expire_cache(cache_dir, drop=['etag'])
+    assert fetch(server, cache_dir, bundled)[1] == 'not-modified'
+    validators = [(headers.get('If-None-Match'), headers.get('If-Modified-Since')) for headers in WorkbookHandler.requests]
+    assert validators == [(None, None), ('"v1"', LAST_MODIFIED), (None, LAST_MODIFIED)]
+
+def test_corrupt_cache_within_ttl_is_fetched_again(server, tmp_path, bundled):
+    corrupt_cache(tmp_path / 'cache', server, time.time())
+    df, source, error = fetch(server, tmp_path / 'cache', bundled)
+    assert (source, error) == ('remote', None)
+    assert df['Description'].tolist() == ['Item 0', 'Item 1', 'Item 2']
+    # The unconditional fetch repaired the cache
+    assert fetch(server, tmp_path / 'cache', bundled)[1] == 'cache'
+
+def test_corrupt_cache_after_not_modified_is_fetched_again(server, tmp_path, bundled):
+    corrupt_cache(tmp_path / 'cache', server, 0)
+    df, source, _ = fetch(server, tmp_path / 'cache', bundled)
+    assert source == 'remote'
+    assert len(df) == 3
+    assert [headers.get('If-None-Match') for headers in WorkbookHandler.requests] == ['"v1"', None]
+
+def test_corrupt_cache_without_network_falls_back_to_bundled_file(tmp_path, bundled):
+    url = 'http://127.0.0.1:9/inventory_data.xlsx'
+    corrupt_cache(tmp_path / 'cache', url, time.time())
+    df, source, error = fetch(url, tmp_path / 'cache', bundled)
+    assert source == 'bundled'
+    assert error is not None
+    assert df['Description'].tolist() == ['Item 50', 'Item 51']